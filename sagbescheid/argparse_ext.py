@@ -2,7 +2,12 @@
 # coding: utf-8
 # Copyright © 2015 Wieland Hoffmann
 # License: MIT, see LICENSE for details
-from argparse import Action
+import re
+
+
+from .filters import pattern_to_regex
+from .notifier import EVENTS
+from argparse import Action, ArgumentTypeError
 
 
 class TestAction(Action):
@@ -13,3 +18,110 @@ class TestAction(Action):
             parser.error("--test needs at least one --unit")
         else:
             setattr(namespace, self.dest, True)
+
+
+def event_window(value):
+    """Parse an ``EVENT=SECONDS`` argument.
+
+    :type value: str
+    :rtype: (str, float)
+    """
+    event_name, _, seconds = value.partition("=")
+    if event_name not in EVENTS:
+        raise ArgumentTypeError("%s is not one of %s" %
+                                (event_name, ", ".join(EVENTS)))
+    try:
+        seconds = float(seconds)
+    except ValueError:
+        raise ArgumentTypeError("%s is not a number of seconds" % seconds)
+    return event_name, seconds
+
+
+def positive_int(value):
+    """Parse an integer that is at least 1.
+
+    :type value: str
+    :rtype: int
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise ArgumentTypeError("%s is not a number" % value)
+    if number < 1:
+        raise ArgumentTypeError("%s is not a positive number" % value)
+    return number
+
+
+def unit_pattern(value):
+    """Check that ``value`` is a valid pattern for
+    :func:`sagbescheid.filters.compile_unit_filter`.
+
+    :type value: str
+    :rtype: str
+    """
+    try:
+        re.compile(pattern_to_regex(value))
+    except re.error as e:
+        raise ArgumentTypeError("%s is not a valid regular expression: %s" %
+                                (value, e))
+    return value
+
+
+def route(value):
+    """Parse a ``NOTIFIER=EVENT[,EVENT...][@PATTERN[,PATTERN...]]``
+    argument. ``*`` as the events means all events.
+
+    :type value: str
+    :return: The name of the notifier, the event names and the unit name
+             patterns, ``None`` meaning all of them.
+    :rtype: (str, [str], [str])
+    """
+    notifier_name, _, rest = value.partition("=")
+    if not notifier_name or not rest:
+        raise ArgumentTypeError("%s is not of the form "
+                                "NOTIFIER=EVENTS[@PATTERNS]" % value)
+    events, _, patterns = rest.partition("@")
+    event_names = None
+    if events != "*":
+        event_names = events.split(",")
+        for event_name in event_names:
+            if event_name not in EVENTS + ["flapping"]:
+                raise ArgumentTypeError("%s is not one of %s" %
+                                        (event_name,
+                                         ", ".join(EVENTS + ["flapping"])))
+    unit_patterns = None
+    if patterns:
+        unit_patterns = [unit_pattern(pattern)
+                         for pattern in patterns.split(",")]
+    return notifier_name, event_names, unit_patterns
+
+
+def http_header(value):
+    """Parse a ``NAME: VALUE`` argument.
+
+    :type value: str
+    :rtype: (str, str)
+    """
+    name, _, header_value = value.partition(":")
+    if not name.strip() or not header_value.strip():
+        raise ArgumentTypeError("%s is not of the form NAME: VALUE" % value)
+    return name.strip(), header_value.strip()
+
+
+def secret_file(value):
+    """Read a shared secret from the file ``value``. Leading and trailing
+    whitespace is ignored.
+
+    :type value: str
+    :rtype: str
+    """
+    try:
+        with open(value, "rb") as source:
+            secret = source.read().strip().decode("utf-8")
+    except (IOError, OSError) as e:
+        raise ArgumentTypeError("Can't read %s: %s" % (value, e))
+    except UnicodeDecodeError:
+        raise ArgumentTypeError("%s is not UTF-8 encoded" % value)
+    if not secret:
+        raise ArgumentTypeError("%s is empty" % value)
+    return secret
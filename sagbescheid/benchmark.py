@@ -0,0 +1,515 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Measure sagbescheid against a simulated systemd.
+
+The real :func:`sagbescheid.sagbescheid.setup`, units and notifier registry
+are used, only the D-Bus connection is replaced by
+:class:`FakeSystemdConnection`, which emulates ``org.freedesktop.systemd1``
+in-process. Signals are routed through txdbus' own message router, just like
+signals received from a real bus.
+
+Run it with ``python -m sagbescheid.benchmark``. Arguments after ``--`` are
+passed on to sagbescheid, for example::
+
+    python -m sagbescheid.benchmark --units 5000 -- --shared-match-rule
+    python -m sagbescheid.benchmark --units 5000 -- --unit-type service
+
+By default, the benchmark runs once with :class:`sagbescheid.unit.TableUnit`
+and once with the automat based :class:`sagbescheid.unit.Unit`, see
+``--unit-class``.
+
+``--codec`` measures the escaping and unescaping of unit names instead.
+
+``--introspection`` compares connecting ``--units`` units with the static
+:data:`sagbescheid.unit.UNIT_INTERFACES` to connecting them with the
+interfaces obtained by introspecting every unit. The simulated systemd answers
+``Introspect`` with a description of the ``org.freedesktop.systemd1.Unit``
+interface, so this measures parsing it, but not the round trip to a real bus.
+"""
+import argparse
+import logging
+import resource
+import sys
+
+
+from .sagbescheid import build_arg_parser, get_unit_class, setup
+from .unit import (escape_path_label, MANAGER_PATH, PROPERTIES_IFACE,
+                   SYSTEMD_BUS_NAME, UNIT_IFACE, UNIT_PATH_PREFIX, percentile,
+                   TableUnit, unescape_path_label, unit_name)
+from collections import deque
+from timeit import default_timer
+from twisted.internet import defer, reactor, task
+from txdbus import introspection, marshal, objects, router
+from txdbus.message import SignalMessage
+
+
+# The sagbescheid arguments selecting each unit class.
+UNIT_CLASS_ARGS = [("table", "--fast-transitions"),
+                   ("automat", "--no-fast-transitions")]
+
+# The ActiveStates every unit cycles through while signals are emitted.
+STATE_CYCLE = ["deactivating", "inactive", "activating", "active"]
+
+# The types of the simulated units, assigned in this order. This is roughly
+# the mix ListUnits returns on a typical server, only a quarter of the units
+# are services.
+UNIT_TYPES = ["service", "device", "mount", "device", "scope", "service",
+              "socket", "device", "target", "service", "slice", "mount"]
+
+# The methods and properties of org.freedesktop.systemd1.Unit, as introspected
+# on systemd 252.
+UNIT_METHODS = [("Start", "s", "o"), ("Stop", "s", "o"), ("Reload", "s", "o"),
+                ("Restart", "s", "o"), ("TryRestart", "s", "o"),
+                ("ReloadOrRestart", "s", "o"),
+                ("ReloadOrTryRestart", "s", "o"),
+                ("EnqueueJob", "ss", "uososa(uosos)"), ("Kill", "si", ""),
+                ("ResetFailed", "", ""), ("SetProperties", "ba(sv)", ""),
+                ("Ref", "", ""), ("Unref", "", ""), ("Clean", "as", ""),
+                ("Freeze", "", ""), ("Thaw", "", "")]
+UNIT_PROPERTIES = [
+    ("Id", "s"), ("Names", "as"), ("Following", "s"), ("Requires", "as"),
+    ("Requisite", "as"), ("Wants", "as"), ("BindsTo", "as"),
+    ("PartOf", "as"), ("Upholds", "as"), ("RequiredBy", "as"),
+    ("RequisiteOf", "as"), ("WantedBy", "as"), ("BoundBy", "as"),
+    ("UpheldBy", "as"), ("ConsistsOf", "as"), ("Conflicts", "as"),
+    ("ConflictedBy", "as"), ("Before", "as"), ("After", "as"),
+    ("OnSuccess", "as"), ("OnSuccessOf", "as"), ("OnFailure", "as"),
+    ("OnFailureOf", "as"), ("Triggers", "as"), ("TriggeredBy", "as"),
+    ("PropagatesReloadTo", "as"), ("ReloadPropagatedFrom", "as"),
+    ("JoinsNamespaceOf", "as"), ("RequiresMountsFor", "as"),
+    ("Documentation", "as"), ("Description", "s"), ("LoadState", "s"),
+    ("ActiveState", "s"), ("FreezerState", "s"), ("SubState", "s"),
+    ("FragmentPath", "s"), ("SourcePath", "s"), ("DropInPaths", "as"),
+    ("UnitFileState", "s"), ("UnitFilePreset", "s"),
+    ("StateChangeTimestamp", "t"), ("StateChangeTimestampMonotonic", "t"),
+    ("InactiveExitTimestamp", "t"), ("InactiveExitTimestampMonotonic", "t"),
+    ("ActiveEnterTimestamp", "t"), ("ActiveEnterTimestampMonotonic", "t"),
+    ("ActiveExitTimestamp", "t"), ("ActiveExitTimestampMonotonic", "t"),
+    ("InactiveEnterTimestamp", "t"), ("InactiveEnterTimestampMonotonic", "t"),
+    ("CanStart", "b"), ("CanStop", "b"), ("CanReload", "b"),
+    ("CanIsolate", "b"), ("CanClean", "as"), ("CanFreeze", "b"),
+    ("Job", "(uo)"), ("StopWhenUnneeded", "b"), ("RefuseManualStart", "b"),
+    ("RefuseManualStop", "b"), ("AllowIsolate", "b"),
+    ("DefaultDependencies", "b"), ("OnSuccessJobMode", "s"),
+    ("OnFailureJobMode", "s"), ("IgnoreOnIsolate", "b"),
+    ("NeedDaemonReload", "b"), ("Markers", "as"), ("JobTimeoutUSec", "t"),
+    ("JobRunningTimeoutUSec", "t"), ("JobTimeoutAction", "s"),
+    ("JobTimeoutRebootArgument", "s"), ("ConditionResult", "b"),
+    ("AssertResult", "b"), ("ConditionTimestamp", "t"),
+    ("ConditionTimestampMonotonic", "t"), ("AssertTimestamp", "t"),
+    ("AssertTimestampMonotonic", "t"), ("Conditions", "a(sbbsi)"),
+    ("Asserts", "a(sbbsi)"), ("LoadError", "(ss)"), ("Transient", "b"),
+    ("Perpetual", "b"), ("StartLimitIntervalUSec", "t"),
+    ("StartLimitBurst", "u"), ("StartLimitAction", "s"),
+    ("FailureAction", "s"), ("FailureActionExitStatus", "i"),
+    ("SuccessAction", "s"), ("SuccessActionExitStatus", "i"),
+    ("RebootArgument", "s"), ("InvocationID", "ay"), ("CollectMode", "s"),
+    ("Refs", "as"), ("ActivationDetails", "a(ss)")]
+
+
+def unit_introspection_xml():
+    """Return the reply to ``Introspect`` for a unit.
+
+    :rtype: str
+    """
+    lines = ['<!DOCTYPE node PUBLIC '
+             '"-//freedesktop//DTD D-BUS Object Introspection 1.0//EN" '
+             '"http://www.freedesktop.org/standards/dbus/1.0/'
+             'introspect.dtd">',
+             '<node>',
+             ' <interface name="org.freedesktop.DBus.Peer">',
+             '  <method name="Ping"/>',
+             '  <method name="GetMachineId">',
+             '   <arg type="s" name="machine_uuid" direction="out"/>',
+             '  </method>',
+             ' </interface>',
+             ' <interface name="org.freedesktop.DBus.Introspectable">',
+             '  <method name="Introspect">',
+             '   <arg name="data" type="s" direction="out"/>',
+             '  </method>',
+             ' </interface>',
+             ' <interface name="{}">'.format(PROPERTIES_IFACE),
+             '  <method name="Get">',
+             '   <arg name="interface" direction="in" type="s"/>',
+             '   <arg name="property" direction="in" type="s"/>',
+             '   <arg name="value" direction="out" type="v"/>',
+             '  </method>',
+             '  <method name="GetAll">',
+             '   <arg name="interface" direction="in" type="s"/>',
+             '   <arg name="properties" direction="out" type="a{sv}"/>',
+             '  </method>',
+             '  <method name="Set">',
+             '   <arg name="interface" direction="in" type="s"/>',
+             '   <arg name="property" direction="in" type="s"/>',
+             '   <arg name="value" direction="in" type="v"/>',
+             '  </method>',
+             '  <signal name="PropertiesChanged">',
+             '   <arg type="s" name="interface"/>',
+             '   <arg type="a{sv}" name="changed_properties"/>',
+             '   <arg type="as" name="invalidated_properties"/>',
+             '  </signal>',
+             ' </interface>',
+             ' <interface name="{}">'.format(UNIT_IFACE)]
+    for name, arguments, returns in UNIT_METHODS:
+        lines.append('  <method name="{}">'.format(name))
+        lines.extend('   <arg type="{}" direction="in"/>'.format(arg)
+                     for arg in marshal.genCompleteTypes(arguments))
+        if returns:
+            lines.append('   <arg type="{}" direction="out"/>'.format(
+                returns))
+        lines.append('  </method>')
+    for name, signature in UNIT_PROPERTIES:
+        lines.append('  <property name="{}" type="{}" access="read"/>'.format(
+            name, signature))
+    lines.extend([' </interface>', '</node>'])
+    return "\n".join(lines)
+
+
+class FakeManager(object):
+    """Emulates the remote ``org.freedesktop.systemd1.Manager`` object."""
+
+    def __init__(self, con):
+        """
+        :type con: :class:`FakeSystemdConnection`
+        """
+        self.con = con
+
+    def callRemote(self, method, *args, **kwargs):
+        if method == "ListUnits":
+            names = self.con.units.keys()
+        elif method == "ListUnitsByNames":
+            names = [name for name in args[0] if name in self.con.units]
+        elif method == "Subscribe":
+            return defer.succeed(None)
+        else:
+            raise NotImplementedError(method)
+        return defer.succeed([
+            (name, "", "loaded", self.con.units[name], "", "",
+             self.con.unit_path(name), 0, "", "/")
+            for name in names])
+
+    def notifyOnSignal(self, signal_name, callback, interface=None):
+        return defer.succeed(None)
+
+
+class FakeSystemdConnection(object):
+    """A stand-in for :class:`txdbus.client.DBusClientConnection` connected
+    to a systemd with ``unit_count`` units.
+    """
+
+    def __init__(self, unit_count):
+        """
+        :type unit_count: int
+        """
+        self.units = dict(
+            ("bench-{}.{}".format(index, UNIT_TYPES[index % len(UNIT_TYPES)]),
+             "active")
+            for index in range(unit_count))
+        self.router = router.MessageRouter()
+        self.objHandler = objects.DBusObjectHandler(self)
+        self.introspection_xml = unit_introspection_xml()
+
+    @staticmethod
+    def unit_path(name):
+        """
+        :type name: str
+        :rtype: str
+        """
+        return UNIT_PATH_PREFIX + escape_path_label(name)
+
+    def getRemoteObject(self, busName, objectPath, interfaces=None,
+                        replaceKnownInterfaces=False):
+        if objectPath == MANAGER_PATH:
+            return defer.succeed(FakeManager(self))
+        return self.objHandler.getRemoteObject(busName, objectPath,
+                                               interfaces)
+
+    def introspectRemoteObject(self, busName, objectPath,
+                               replaceKnownInterfaces=False):
+        return defer.succeed(introspection.getInterfacesFromXML(
+            self.introspection_xml, replaceKnownInterfaces))
+
+    def addMatch(self, callback, mtype=None, sender=None, interface=None,
+                 member=None, path=None, path_namespace=None,
+                 destination=None, arg=None, arg_path=None,
+                 arg0namespace=None):
+        return defer.succeed(self.router.addMatch(
+            callback, mtype, sender, interface, member, path, path_namespace,
+            destination, arg, arg_path, arg0namespace))
+
+    def delMatch(self, rule_id):
+        self.router.delMatch(rule_id)
+
+    def build_signal(self, name, state):
+        """Return the ``PropertiesChanged`` signal for unit ``name`` entering
+        ``state``.
+
+        :type name: str
+        :type state: str
+        :rtype: :class:`txdbus.message.SignalMessage`
+        """
+        self.units[name] = state
+        return SignalMessage(self.unit_path(name), "PropertiesChanged",
+                             PROPERTIES_IFACE, signature="sa{sv}as",
+                             body=[UNIT_IFACE, {"ActiveState": state}, []])
+
+    def emit(self, message):
+        """
+        :type message: :class:`txdbus.message.SignalMessage`
+        """
+        self.router.routeMessage(message)
+
+
+class LatencyNotifier(object):
+    """Records the time between emitting a signal and an event for it
+    arriving at a notifier.
+    """
+
+    name = "benchmark"
+
+    def __init__(self):
+        self.sent = {}
+        self.latencies = []
+
+    def add_arguments(self, group):
+        pass
+
+    def handle_arguments(self, args):
+        pass
+
+    def _record(self, object_path, *args):
+        sent = self.sent.get(object_path)
+        if sent is not None:
+            self.latencies.append(default_timer() - sent)
+
+    normal_start = normal_stop = failure = ongoing_failure = recovery = \
+        flapping = _record
+
+    def change_from_unknown(self, object_path):
+        pass
+
+
+def rss():
+    """Return the resident set size of this process in KiB.
+
+    :rtype: int
+    """
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+@defer.inlineCallbacks
+def run(options, daemon_args):
+    """
+    :type options: :class:`argparse.Namespace`
+    :type daemon_args: :class:`argparse.Namespace`
+    """
+    con = FakeSystemdConnection(options.units)
+    notifier = LatencyNotifier()
+    rss_before = rss()
+
+    start = default_timer()
+    tracker = yield setup(daemon_args, con, [notifier])
+    startup = default_timer() - start
+    rss_after_startup = rss()
+
+    names = sorted(con.units)
+    messages = deque()
+    for index in range(options.signals):
+        name = names[index % len(names)]
+        state = STATE_CYCLE[(index // len(names)) % len(STATE_CYCLE)]
+        messages.append((con.unit_path(name), con.build_signal(name, state)))
+
+    start = default_timer()
+    if options.rate > 0:
+        # Emit the signals in batches every 10ms to reach the rate.
+        batch = max(1, int(options.rate / 100.0))
+
+        def emit_batch():
+            for _ in range(min(batch, len(messages))):
+                object_path, message = messages.popleft()
+                notifier.sent[object_path] = default_timer()
+                con.emit(message)
+            if not messages:
+                loop.stop()
+
+        loop = task.LoopingCall(emit_batch)
+        yield loop.start(0.01)
+    else:
+        for object_path, message in messages:
+            notifier.sent[object_path] = default_timer()
+            con.emit(message)
+    elapsed = default_timer() - start
+
+    # Give queued events a chance to reach the notifier.
+    yield task.deferLater(reactor, 0.1, lambda: None)
+
+    report = [
+        ("unit class", get_unit_class(daemon_args).__name__),
+        ("units", "{}".format(len(tracker.units))),
+        ("startup to READY", "{:.3f}s".format(startup)),
+        ("signals", "{}".format(options.signals)),
+        ("signals per second", "{:.0f}".format(options.signals / elapsed)),
+        ("events", "{}".format(len(notifier.latencies))),
+        ("event latency p50", "{:.1f}us".format(
+            (percentile(notifier.latencies, 0.5) or 0) * 1e6)),
+        ("event latency p99", "{:.1f}us".format(
+            (percentile(notifier.latencies, 0.99) or 0) * 1e6)),
+        ("RSS before startup", "{} KiB".format(rss_before)),
+        ("RSS after startup", "{} KiB".format(rss_after_startup)),
+        ("max RSS", "{} KiB".format(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)),
+    ]
+    for label, value in report:
+        sys.stdout.write("{:<20} {}\n".format(label + ":", value))
+
+
+def run_codec(count):
+    """Measure how many unit names per second can be escaped and unescaped.
+
+    :param count: The number of unit names.
+    :type count: int
+    """
+    names = ["bench-{}@instance_{}.{}".format(
+        index, index % 7, UNIT_TYPES[index % len(UNIT_TYPES)])
+        for index in range(count)]
+    paths = [UNIT_PATH_PREFIX + escape_path_label(name) for name in names]
+    labels = [path[len(UNIT_PATH_PREFIX):] for path in paths]
+
+    timings = []
+    for stage, func, values in [("escape", escape_path_label, names),
+                                ("unescape", unescape_path_label, labels),
+                                ("unit_name, first", unit_name, paths),
+                                ("unit_name, cached", unit_name, paths)]:
+        start = default_timer()
+        for value in values:
+            func(value)
+        timings.append((stage, default_timer() - start))
+
+    sys.stdout.write("{:<20} {}\n".format("names:", count))
+    for stage, elapsed in timings:
+        sys.stdout.write("{:<20} {:.0f} names/s\n".format(stage + ":",
+                                                         count / elapsed))
+
+
+@defer.inlineCallbacks
+def connect_introspecting(unit, con):
+    """Like :meth:`sagbescheid.unit.BaseUnit.connect`, but introspect the
+    unit instead of using :data:`sagbescheid.unit.UNIT_INTERFACES`.
+
+    :type unit: :class:`sagbescheid.unit.BaseUnit`
+    :type con: :class:`FakeSystemdConnection`
+    """
+    robj = yield con.getRemoteObject(SYSTEMD_BUS_NAME, unit.object_path)
+    rule_id = yield robj.notifyOnSignal("PropertiesChanged", unit.onSignal)
+    unit._subscription = (robj, rule_id)
+
+
+@defer.inlineCallbacks
+def run_introspection(count):
+    """Measure how many units per second can be connected with static
+    interfaces and with introspection.
+
+    :param count: The number of units.
+    :type count: int
+    """
+    con = FakeSystemdConnection(count)
+    paths = [con.unit_path(name) for name in sorted(con.units)]
+    timings = []
+    for stage, connect in [("static interfaces",
+                            lambda unit: unit.connect(con)),
+                           ("introspection",
+                            lambda unit: connect_introspecting(unit, con))]:
+        units = [TableUnit(path, None) for path in paths]
+        start = default_timer()
+        for unit in units:
+            yield connect(unit)
+        timings.append((stage, default_timer() - start))
+        for unit in units:
+            unit.disconnect()
+
+    sys.stdout.write("{:<20} {}\n".format("units:", count))
+    sys.stdout.write("{:<20} {} bytes\n".format(
+        "introspection data:", len(con.introspection_xml)))
+    for stage, elapsed in timings:
+        sys.stdout.write("{:<20} {:.0f} units/s\n".format(stage + ":",
+                                                          count / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="sagbescheid.benchmark",
+        description="Measure sagbescheid against a simulated systemd. "
+        "Arguments after -- are passed on to sagbescheid.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--units", action="store", type=int, default=1000,
+                        help="The number of simulated units.")
+    parser.add_argument("--signals", action="store", type=int,
+                        default=100000,
+                        help="The number of PropertiesChanged signals to "
+                        "emit.")
+    parser.add_argument("--rate", action="store", type=float, default=0,
+                        help="Signals per second, 0 emits them as fast as "
+                        "possible.")
+    parser.add_argument("--unit-class", action="store", default="both",
+                        choices=[name for name, _ in UNIT_CLASS_ARGS] +
+                        ["both"],
+                        help="The units to benchmark. both runs the "
+                        "benchmark for every unit class, one after the "
+                        "other.")
+    parser.add_argument("--codec", action="store_true", default=False,
+                        help="Measure escaping and unescaping --units unit "
+                        "names instead of running sagbescheid.")
+    parser.add_argument("--introspection", action="store_true",
+                        default=False,
+                        help="Compare connecting --units units with static "
+                        "interfaces and with introspection instead of "
+                        "running sagbescheid.")
+    parser.add_argument("daemon_args", nargs=argparse.REMAINDER,
+                        help="Arguments for sagbescheid.")
+    options = parser.parse_args()
+    if options.codec:
+        run_codec(options.units)
+        return
+    if options.introspection:
+        reactor.callWhenRunning(
+            lambda: run_introspection(options.units).addErrback(
+                lambda failure: failure.printTraceback()).addBoth(
+                lambda _: reactor.stop()))
+        reactor.run()
+        return
+
+    daemon_args = options.daemon_args
+    if daemon_args[:1] == ["--"]:
+        daemon_args = daemon_args[1:]
+    parser = build_arg_parser()
+    runs = [parser.parse_args(["--all-units", class_arg] + daemon_args)
+            for name, class_arg in UNIT_CLASS_ARGS
+            if options.unit_class in (name, "both")]
+
+    logging.basicConfig(level=logging.WARNING)
+
+    @defer.inlineCallbacks
+    def run_all():
+        for index, run_args in enumerate(runs):
+            if index:
+                sys.stdout.write("\n")
+            yield run(options, run_args)
+
+    def done(result):
+        reactor.stop()
+        return result
+
+    reactor.callWhenRunning(
+        lambda: run_all().addErrback(
+            lambda failure: failure.printTraceback()).addBoth(done))
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
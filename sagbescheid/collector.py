@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""The collector receives the events of sagbescheid agents using the
+``forward`` notifier and passes them on to its own notifiers.
+"""
+import argparse
+import logging
+import sys
+
+
+from .argparse_ext import secret_file
+from .config import ConfigArgumentParser, parse_arguments
+from .forwarding import CollectorFactory
+from .notifier import get_enabled_notifiers, NotifierRegistry
+from .sagbescheid import (add_notifier_arguments, systemd_ready,
+                          systemd_status)
+from twisted.internet import reactor, task
+from twisted.python import log
+
+
+def build_arg_parser():
+    parser = ConfigArgumentParser(prog='sagbescheid-collector',
+                                  fromfile_prefix_chars='@',
+                                  description='Collect the events of '
+                                  'many sagbescheid agents',
+                                  formatter_class=argparse.ArgumentDefaultsHelpFormatter)  # noqa
+    add_notifier_arguments(parser)
+    parser.add_argument("--config", action="store", metavar="FILE",
+                        help="Read options from this INI file. Options given "
+                        "on the command line replace the same options in the "
+                        "file.")
+    parser.add_argument("--listen-port", action="store", type=int,
+                        default=9734,
+                        help="The port to accept agent connections on.")
+    parser.add_argument("--listen-interface", action="store",
+                        default="127.0.0.1",
+                        help="The address to accept agent connections on. "
+                        "Use 0.0.0.0 or :: to accept them on all addresses.")
+    parser.add_argument("--secret-file", action="store", type=secret_file,
+                        metavar="FILE",
+                        help="Only accept agents that send the secret in "
+                        "this file with --forward-secret-file. It's sent in "
+                        "plain text, so use a VPN or a TLS tunnel across "
+                        "untrusted networks.")
+    parser.add_argument("-v", "--verbose", action="store_true", default=False,
+                        help="Be more verbose.")
+    return parser
+
+
+def main():
+    observer = log.PythonLoggingObserver(loggerName="")
+    observer.start()
+
+    parser = build_arg_parser()
+    args = parse_arguments(parser, sys.argv[1:])
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+    notifiers = get_enabled_notifiers(args.notifier)
+    for notifier in notifiers:
+        notifier.handle_arguments(args)
+
+    registry = NotifierRegistry(notifiers,
+                                args.notifier_queue_size,
+                                args.notifier_overflow,
+                                dict(args.flap_window),
+                                args.route)
+    if args.secret_file is None and args.listen_interface not in (
+            "127.0.0.1", "::1", "localhost"):
+        logging.warning("Accepting events from everyone who can connect to "
+                        "%s, see --secret-file", args.listen_interface)
+    factory = CollectorFactory(registry, args.secret_file)
+    # Lots of agents reconnect at the same time after a restart.
+    reactor.listenTCP(args.listen_port, factory, backlog=1024,
+                      interface=args.listen_interface)
+    systemd_ready()
+    task.LoopingCall(lambda: systemd_status(
+        "{} agents connected.".format(factory.agents))).start(60)
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
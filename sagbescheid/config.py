@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Configuration files.
+
+A configuration file is an INI file whose keys are the names of command line
+options without the leading ``--``. Options of notifiers go into a section
+named after the notifier, without the notifier name in the key, all others
+into the ``sagbescheid`` section::
+
+    [sagbescheid]
+    all-units = yes
+    unit-type = service
+    notifier = smtp
+               irc
+    route = smtp=failure,ongoing_failure,recovery
+
+    [smtp]
+    host = mail.example.com
+    port = 25
+
+Options that can be given more than once take one value per line. Options
+without a value are enabled with ``yes`` and left out with ``no``.
+
+An option given on the command line replaces all values of the same option in
+the file. One of a group of mutually exclusive options, like ``--unit`` and
+``--all-units``, replaces all options of the group in the file.
+"""
+import argparse
+
+from six.moves import configparser
+
+
+# The section of all options that don't belong to a notifier.
+MAIN_SECTION = "sagbescheid"
+
+TRUE_VALUES = ("1", "yes", "true", "on")
+FALSE_VALUES = ("0", "no", "false", "off")
+
+
+class RecordingGroup(object):
+    """Wraps an argument group, remembering the destinations and actions of
+    all arguments added to it and passing the actions on to ``parser``, if
+    given.
+    """
+
+    def __init__(self, group, parser=None):
+        """
+        :type group: :class:`argparse._ArgumentGroup`
+        :type parser: :class:`ConfigArgumentParser`
+        """
+        self.group = group
+        self.parser = parser
+        self.dests = []
+        self.actions = []
+
+    def add_argument(self, *args, **kwargs):
+        action = self.group.add_argument(*args, **kwargs)
+        self.dests.append(action.dest)
+        self.actions.append(action)
+        if self.parser is not None:
+            self.parser.add_option_action(action)
+        return action
+
+    def __getattr__(self, name):
+        return getattr(self.group, name)
+
+
+class ConfigArgumentParser(argparse.ArgumentParser):
+    """An argument parser that remembers the actions of its options and its
+    mutually exclusive groups, so :func:`parse_arguments` can read them from
+    configuration files.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # ArgumentParser.__init__ already adds --help.
+        self.option_actions = {}
+        self.exclusive_groups = []
+        argparse.ArgumentParser.__init__(self, *args, **kwargs)
+
+    def add_option_action(self, action):
+        """
+        :type action: :class:`argparse.Action`
+        """
+        for option_string in action.option_strings:
+            self.option_actions[option_string] = action
+
+    def get_option_action(self, option):
+        """Return the action of ``option``, which may be an unambiguous
+        prefix of a long option, like on the command line.
+
+        :type option: str
+        :rtype: :class:`argparse.Action` or None
+        """
+        if option in self.option_actions:
+            return self.option_actions[option]
+        # Python 2 always allows abbreviations.
+        if not option.startswith("--") or not getattr(self, "allow_abbrev",
+                                                      True):
+            return None
+        actions = set(action for option_string, action
+                      in self.option_actions.items()
+                      if option_string.startswith(option))
+        return actions.pop() if len(actions) == 1 else None
+
+    def add_argument(self, *args, **kwargs):
+        action = argparse.ArgumentParser.add_argument(self, *args, **kwargs)
+        self.add_option_action(action)
+        return action
+
+    def add_argument_group(self, *args, **kwargs):
+        return RecordingGroup(
+            argparse.ArgumentParser.add_argument_group(self, *args, **kwargs),
+            self)
+
+    def add_mutually_exclusive_group(self, **kwargs):
+        group = RecordingGroup(
+            argparse.ArgumentParser.add_mutually_exclusive_group(self,
+                                                                 **kwargs),
+            self)
+        self.exclusive_groups.append(group.actions)
+        return group
+
+
+def read_config(filename, parser):
+    """Return the options in the configuration file ``filename`` as command
+    line arguments for ``parser``, together with their actions.
+
+    :type filename: str
+    :type parser: :class:`ConfigArgumentParser`
+    :rtype: [(:class:`argparse.Action`, [str])]
+    :raises IOError: If the file can't be read.
+    :raises ValueError: If the file contains unknown options.
+    :raises configparser.Error: If the file is not a valid INI file.
+    """
+    config = configparser.RawConfigParser()
+    if not config.read([filename]):
+        raise IOError("Can't read the configuration file %s" % filename)
+
+    arguments = []
+    for section in config.sections():
+        prefix = "--" if section == MAIN_SECTION else "--%s-" % section
+        for key, value in config.items(section):
+            option = prefix + key
+            action = parser.option_actions.get(option)
+            if action is None or option == "--config":
+                raise ValueError("Unknown option %s in section %s of %s" %
+                                 (key, section, filename))
+            if action.nargs == 0:
+                if value.lower() in TRUE_VALUES:
+                    arguments.append((action, [option]))
+                elif value.lower() not in FALSE_VALUES:
+                    raise ValueError("%s in section %s of %s has to be yes "
+                                     "or no" % (key, section, filename))
+                continue
+            for line in value.splitlines():
+                if line.strip():
+                    arguments.append((action, [option, line.strip()]))
+    return arguments
+
+
+def command_line_dests(parser, argv):
+    """Return the destinations of all options in ``argv``, and of the
+    options mutually exclusive with them.
+
+    :type parser: :class:`ConfigArgumentParser`
+    :type argv: [str]
+    :rtype: set
+    """
+    dests = set()
+    for argument in argv:
+        if argument == "--":
+            break
+        if not argument.startswith("-"):
+            continue
+        action = parser.get_option_action(argument.split("=", 1)[0])
+        if action is not None:
+            dests.add(action.dest)
+    for group in parser.exclusive_groups:
+        group_dests = set(action.dest for action in group)
+        if dests.intersection(group_dests):
+            dests.update(group_dests)
+    return dests
+
+
+def parse_arguments(parser, argv):
+    """Parse ``argv`` with ``parser``, preceded by the options from the
+    configuration file given with ``--config``, if any, that aren't replaced
+    by options in ``argv``.
+
+    :type parser: :class:`ConfigArgumentParser`
+    :type argv: [str]
+    :rtype: :class:`argparse.Namespace`
+    """
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument("--config")
+    known, _ = config_parser.parse_known_args(argv)
+    if known.config is None:
+        return parser.parse_args(argv)
+    try:
+        config_options = read_config(known.config, parser)
+    except (IOError, ValueError, configparser.Error) as e:
+        parser.error(str(e))
+    replaced = command_line_dests(parser, argv)
+    config_argv = [argument for action, arguments in config_options
+                   if action.dest not in replaced
+                   for argument in arguments]
+    return parser.parse_args(config_argv + argv)
+
+
+def changed_options(old_args, new_args, dests):
+    """Return the destinations of the options in ``dests`` whose values
+    differ between ``old_args`` and ``new_args``.
+
+    :type old_args: :class:`argparse.Namespace`
+    :type new_args: :class:`argparse.Namespace`
+    :type dests: [str]
+    :rtype: [str]
+    """
+    return [dest for dest in dests
+            if getattr(old_args, dest, None) != getattr(new_args, dest, None)]
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import logging
+
+
+from .unit import PROPERTIES_IFACE, SYSTEMD_BUS_NAME, UNIT_PATH_PREFIX
+from twisted.internet import defer
+
+
+class SignalDispatcher(object):
+    """Receives the ``PropertiesChanged`` signals of all units through a single
+    match rule and routes them to the :class:`sagbescheid.unit.Unit` object
+    with the signals object path.
+
+    Compared to :meth:`sagbescheid.unit.Unit.connect`, this needs neither a
+    remote object nor a match rule per unit.
+    """
+
+    def __init__(self):
+        self.units = {}
+        self._rule_id = None
+
+    @defer.inlineCallbacks
+    def connect(self, con):
+        """Install the match rule on ``con``.
+
+        :type con: :class:`txdbus.client.DBusClientConnection`
+        """
+        logging.debug("Installing the match rule for all units")
+        self._rule_id = yield con.addMatch(
+            self._on_signal,
+            mtype="signal",
+            sender=SYSTEMD_BUS_NAME,
+            interface=PROPERTIES_IFACE,
+            member="PropertiesChanged",
+            path_namespace=UNIT_PATH_PREFIX.rstrip("/"))
+
+    def add(self, unit):
+        """Route the signals for ``unit`` to it.
+
+        :type unit: :class:`sagbescheid.unit.Unit`
+        """
+        self.units[unit.object_path] = unit
+
+    def remove(self, object_path):
+        """Stop routing signals for ``object_path`` and return the unit that
+        has been receiving them, if any.
+
+        :type object_path: str
+        :rtype: :class:`sagbescheid.unit.Unit`
+        """
+        return self.units.pop(object_path, None)
+
+    def _on_signal(self, message):
+        """
+        :type message: :class:`txdbus.message.SignalMessage`
+        """
+        unit = self.units.get(message.path)
+        if unit is None:
+            return
+        unit.onSignal(*message.body)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import re
+
+
+# Patterns starting with this are regular expressions instead of globs.
+REGEX_PREFIX = "re:"
+
+
+def glob_to_regex(pattern):
+    """Translate the glob ``pattern`` into a regular expression. ``*``
+    matches any number of characters, ``?`` a single one.
+
+    :type pattern: str
+    :rtype: str
+    """
+    parts = []
+    for char in pattern:
+        if char == "*":
+            parts.append(".*")
+        elif char == "?":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return "".join(parts)
+
+
+def pattern_to_regex(pattern):
+    """
+    :param pattern: A glob, or a regular expression prefixed with
+                    :data:`REGEX_PREFIX`.
+    :type pattern: str
+    :rtype: str
+    """
+    if pattern.startswith(REGEX_PREFIX):
+        return pattern[len(REGEX_PREFIX):]
+    return glob_to_regex(pattern)
+
+
+def _alternatives(patterns):
+    """
+    :type patterns: [str]
+    :rtype: str
+    """
+    return "(?:%s)\\Z" % "|".join("(?:%s)" % pattern_to_regex(pattern)
+                                  for pattern in patterns)
+
+
+def compile_unit_filter(include=None, exclude=None, unit_types=None):
+    """Compile a function returning whether a unit name passes all filters.
+
+    A name passes if it matches at least one of the ``include`` patterns (if
+    there are any), none of the ``exclude`` patterns and ends with one of the
+    ``unit_types`` (if there are any). Patterns always have to match the
+    whole name.
+
+    Everything is compiled into a single regular expression, so checking a
+    name costs a single match.
+
+    :param include: Globs or regular expressions, see
+                    :func:`pattern_to_regex`.
+    :type include: [str]
+    :param exclude: Globs or regular expressions, see
+                    :func:`pattern_to_regex`.
+    :type exclude: [str]
+    :param unit_types: Unit types like ``service`` or ``timer``.
+    :type unit_types: [str]
+    :return: ``None`` if there are no filters at all.
+    :raises re.error: If one of the regular expressions is invalid.
+    """
+    if not (include or exclude or unit_types):
+        return None
+    regex = ""
+    if unit_types:
+        regex += "(?=.*\\.(?:%s)\\Z)" % "|".join(re.escape(unit_type)
+                                                for unit_type in unit_types)
+    if exclude:
+        regex += "(?!%s)" % _alternatives(exclude)
+    if include:
+        regex += _alternatives(include)
+    matcher = re.compile(regex, re.DOTALL).match
+    return lambda name: matcher(name) is not None
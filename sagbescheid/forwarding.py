@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Forwarding events from many sagbescheid agents to a central collector.
+
+Agents send batches of events over a TCP connection, each batch in a frame
+prefixed by its length as a 32 bit integer. A frame is the UTF-8 encoded JSON
+object ``{"host": <name of the agent>, "events": [<event>, ...]}``, where
+every event is a list of the object path, the name of the event and its
+additional arguments, if any. Besides the events, units report their new
+states (``unit_state_changed``, with the name of the state as the argument)
+and their removal (``unit_removed``) the same way.
+
+If the collector is started with a shared secret, the first frame of every
+agent has to be the UTF-8 encoded JSON object ``{"secret": <secret>}``,
+otherwise the agent is disconnected. The secret is sent in plain text, it
+keeps off hosts that can reach the collector, but not those that can read the
+traffic between it and the agents.
+"""
+import hmac
+import json
+import logging
+import os
+import six
+
+
+from .notifier import EVENTS
+from .unit import STATE_NAMES
+from twisted.internet import protocol, reactor
+from twisted.protocols.basic import Int32StringReceiver
+
+
+# The largest frame the collector accepts, in bytes.
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# The number of elements of every event a frame may contain, including the
+# object path and the event name.
+FORWARDED_EVENTS = dict([(event_name, 2) for event_name in EVENTS] +
+                        [("flapping", 5), ("unit_state_changed", 3),
+                         ("unit_removed", 2)])
+
+
+def encode_batch(host, events):
+    """
+    :type host: str
+    :param events: The events, each a list of the object path, the event name
+                   and its additional arguments.
+    :type events: [list]
+    :rtype: bytes
+    """
+    return json.dumps({"host": host, "events": events},
+                      separators=(",", ":")).encode("utf-8")
+
+
+def encode_secret(secret):
+    """
+    :type secret: str
+    :rtype: bytes
+    """
+    return json.dumps({"secret": secret}).encode("utf-8")
+
+
+def decode_secret(frame):
+    """Return the secret in ``frame``, or ``None`` if it doesn't contain
+    one.
+
+    :type frame: bytes
+    :rtype: str
+    """
+    try:
+        secret = json.loads(frame.decode("utf-8"))["secret"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    return secret if isinstance(secret, six.text_type) else None
+
+
+def decode_batch(frame):
+    """Return the host and the events in ``frame``.
+
+    :type frame: bytes
+    :rtype: (str, [list])
+    :raises ValueError: If ``frame`` is not a valid batch.
+    """
+    batch = json.loads(frame.decode("utf-8"))
+    try:
+        host, events = batch["host"], batch["events"]
+    except (KeyError, TypeError):
+        raise ValueError("Not a batch of events")
+    if not isinstance(events, list):
+        raise ValueError("Not a batch of events")
+    return host, events
+
+
+class Spool(object):
+    """Keeps frames while the collector is unreachable.
+
+    Frames are appended to ``filename``, one per line, or kept in memory if
+    there's no file. Once ``max_size`` bytes are spooled, further frames are
+    dropped.
+    """
+
+    def __init__(self, filename=None, max_size=100 * 1024 * 1024):
+        """
+        :type filename: str
+        :type max_size: int
+        """
+        self.filename = filename
+        self.max_size = max_size
+        self.frames = []
+        self.size = 0
+        self.dropped = 0
+        if filename is not None and os.path.exists(filename):
+            # Frames spooled before a restart.
+            self.size = os.path.getsize(filename)
+
+    def append(self, frame):
+        """
+        :type frame: bytes
+        """
+        if self.size + len(frame) + 1 > self.max_size:
+            self.dropped += 1
+            if self.dropped == 1:
+                logging.warning("The spool is full, dropping events until "
+                                "the collector is reachable again")
+            return
+        self.size += len(frame) + 1
+        if self.filename is None:
+            self.frames.append(frame)
+            return
+        with open(self.filename, "ab") as spool:
+            spool.write(frame + b"\n")
+
+    def pop_all(self):
+        """Return and remove all spooled frames.
+
+        :rtype: [bytes]
+        """
+        frames, self.frames = self.frames, []
+        if self.filename is not None and self.size:
+            try:
+                with open(self.filename, "rb") as spool:
+                    frames = spool.read().splitlines()
+                os.remove(self.filename)
+            except (IOError, OSError):
+                logging.exception("Reading the spool %s failed:",
+                                  self.filename)
+        if self.dropped:
+            logging.warning("Dropped %d batches of events while the "
+                            "collector was unreachable", self.dropped)
+        self.size = 0
+        self.dropped = 0
+        return frames
+
+
+class ForwardingProtocol(Int32StringReceiver):
+    def connectionMade(self):
+        if self.factory.secret is not None:
+            self.sendString(encode_secret(self.factory.secret))
+        self.factory.client_ready(self)
+
+    def connectionLost(self, reason):
+        self.factory.client_lost(self)
+
+
+class ForwardingFactory(protocol.ReconnectingClientFactory):
+    """Sends events to a collector in batches.
+
+    Events are collected for ``batch_interval`` seconds, or until there are
+    ``batch_max`` of them, and then sent in one frame. Frames are spooled
+    while there's no connection to the collector and sent once it has been
+    reestablished. If ``secret`` is given, it's sent to the collector first.
+    """
+
+    protocol = ForwardingProtocol
+    maxDelay = 60
+
+    def __init__(self, host, batch_interval, batch_max, spool, secret=None):
+        """
+        :param host: The name of this agent, as shown by the collector.
+        :type host: str
+        :type batch_interval: float
+        :type batch_max: int
+        :type spool: :class:`Spool`
+        :param secret: The secret shared with the collector.
+        :type secret: str
+        """
+        self.host = host
+        self.batch_interval = batch_interval
+        self.batch_max = batch_max
+        self.spool = spool
+        self.secret = secret
+        self.client = None
+        self._batch = []
+        self._batch_call = None
+
+    def send(self, object_path, event_name, *args):
+        """
+        :type object_path: str
+        :type event_name: str
+        :param args: Additional arguments for the event.
+        """
+        self._batch.append([object_path, event_name] + list(args))
+        if len(self._batch) >= self.batch_max:
+            self.flush()
+        elif self._batch_call is None:
+            self._batch_call = reactor.callLater(self.batch_interval,
+                                                 self.flush)
+
+    def flush(self):
+        """Send all collected events as one frame.
+        """
+        if self._batch_call is not None and self._batch_call.active():
+            self._batch_call.cancel()
+        self._batch_call = None
+        if not self._batch:
+            return
+        frame = encode_batch(self.host, self._batch)
+        self._batch = []
+        if self.client is not None:
+            self.client.sendString(frame)
+        else:
+            self.spool.append(frame)
+
+    def client_ready(self, client):
+        """Called when ``client`` connected to the collector. Sends all
+        spooled frames through it.
+
+        :type client: :class:`ForwardingProtocol`
+        """
+        self.resetDelay()
+        self.client = client
+        for frame in self.spool.pop_all():
+            client.sendString(frame)
+
+    def client_lost(self, client):
+        """
+        :type client: :class:`ForwardingProtocol`
+        """
+        if self.client is client:
+            self.client = None
+
+    def stop(self):
+        """Send the collected events and disconnect from the collector for
+        good. Events sent afterwards are spooled.
+        """
+        self.flush()
+        self.stopTrying()
+        if self.client is not None:
+            self.client.transport.loseConnection()
+
+
+class CollectorProtocol(Int32StringReceiver):
+    MAX_LENGTH = MAX_FRAME_SIZE
+
+    def connectionMade(self):
+        self.factory.agents += 1
+        self.peer = self.transport.getPeer()
+        self.authenticated = self.factory.secret is None
+
+    def connectionLost(self, reason):
+        self.factory.agents -= 1
+
+    def stringReceived(self, frame):
+        if self.transport.disconnecting:
+            return
+        if not self.authenticated:
+            self.authenticate(frame)
+            return
+        try:
+            host, events = decode_batch(frame)
+        except ValueError as e:
+            logging.warning("Dropping a malformed batch from %s: %s",
+                            self.peer, e)
+            return
+        for event in events:
+            self.factory.handle_event(host, event)
+
+    def authenticate(self, frame):
+        """Check that ``frame``, the first one of the agent, contains the
+        right secret and disconnect it otherwise.
+
+        :type frame: bytes
+        """
+        secret = decode_secret(frame)
+        if secret is None or not hmac.compare_digest(
+                secret.encode("utf-8"), self.factory.secret.encode("utf-8")):
+            logging.warning("Disconnecting %s, it didn't send the right "
+                            "secret", self.peer)
+            self.transport.loseConnection()
+            return
+        self.authenticated = True
+
+    def lengthLimitExceeded(self, length):
+        logging.warning("Disconnecting %s, it sent a batch of %d bytes",
+                        self.peer, length)
+        Int32StringReceiver.lengthLimitExceeded(self, length)
+
+
+class CollectorFactory(protocol.ServerFactory):
+    """Passes the events of all agents to a single
+    :class:`sagbescheid.notifier.NotifierRegistry`.
+
+    The object paths are prefixed with the name of the agent and a colon, so
+    the notifiers can tell units on different hosts apart. If ``secret`` is
+    given, only agents sending it are accepted.
+    """
+
+    protocol = CollectorProtocol
+
+    def __init__(self, notifier_registry, secret=None):
+        """
+        :type notifier_registry: :class:`sagbescheid.notifier.NotifierRegistry`
+        :param secret: The secret shared with the agents.
+        :type secret: str
+        """
+        self.notifier_registry = notifier_registry
+        self.secret = secret
+        self.agents = 0
+
+    def handle_event(self, host, event):
+        """
+        :type host: str
+        :param event: The object path, the event name and its additional
+                      arguments.
+        :type event: list
+        """
+        if (not isinstance(event, list) or len(event) < 2 or
+                not isinstance(event[1], six.text_type) or
+                FORWARDED_EVENTS.get(event[1]) != len(event) or
+                (event[1] == "unit_state_changed" and
+                 event[2] not in STATE_NAMES)):
+            logging.warning("Dropping the malformed event %r from %s", event,
+                            host)
+            return
+        object_path = u"{}:{}".format(host, event[0])
+        event_name = event[1]
+        registry = self.notifier_registry
+        if event_name == "unit_state_changed":
+            registry.unit_state_changed(object_path, event[2])
+        elif event_name == "unit_removed":
+            registry.unit_removed(object_path)
+        elif event_name == "flapping":
+            # The agent already suppressed the individual events.
+            registry.dispatch(object_path, event_name, *event[2:])
+        else:
+            registry.handle_event(object_path, event_name)
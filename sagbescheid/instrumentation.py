@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import logging
+
+
+from .notifier import EVENTS
+from bisect import bisect_left
+from functools import wraps
+from timeit import default_timer
+
+
+# The upper bounds in seconds of the histogram buckets, from 1us to ~16s.
+BUCKETS = [1e-6 * 2 ** exponent for exponent in range(25)]
+
+
+class Histogram(object):
+    """A latency histogram with exponential buckets."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, duration):
+        """
+        :param duration: A duration in seconds.
+        :type duration: float
+        """
+        self.counts[bisect_left(BUCKETS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def percentile(self, fraction):
+        """Return the upper bound of the bucket containing the ``fraction``
+        percentile, which overestimates the percentile by at most a factor
+        of 2.
+
+        :type fraction: float
+        :rtype: float
+        """
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        """
+        :rtype: str
+        """
+        if not self.count:
+            return "n=0"
+        return "n={} avg={:.1f}us p50<={:.1f}us p99<={:.1f}us max={:.1f}us" \
+            .format(self.count, self.total / self.count * 1e6,
+                    self.percentile(0.5) * 1e6, self.percentile(0.99) * 1e6,
+                    self.max * 1e6)
+
+
+class Instrumentation(object):
+    """Measures how long signals take to be processed.
+
+    Nothing is measured until :meth:`install` wraps the methods in question,
+    so there is no overhead at all if instrumentation is disabled.
+    """
+
+    def __init__(self):
+        self.signals = 0
+        self.stages = {}
+        # The notifiers whose methods are already wrapped.
+        self._notifiers = set()
+
+    def _histogram(self, stage):
+        """
+        :type stage: str
+        :rtype: :class:`Histogram`
+        """
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        return histogram
+
+    def _timed(self, stage, func, count_signals=False):
+        """Return a wrapper around ``func`` that records its duration in the
+        histogram of ``stage``.
+
+        :type stage: str
+        :type count_signals: bool
+        """
+        histogram = self._histogram(stage)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if count_signals:
+                self.signals += 1
+            start = default_timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(default_timer() - start)
+
+        return wrapper
+
+    def install(self, unit_classes, registry):
+        """Start measuring the signal processing of all ``unit_classes`` and
+        the event dispatch of all notifiers in ``registry``.
+
+        This has to happen before any unit is connected.
+
+        :type unit_classes: [:class:`sagbescheid.unit.BaseUnit`]
+        :type registry: :class:`sagbescheid.notifier.NotifierRegistry`
+        """
+        for cls in unit_classes:
+            cls.onSignal = self._timed("onSignal", cls.onSignal, True)
+            # This includes the time spent in the notifiers if events are
+            # delivered to them directly.
+            cls._become = self._timed("transition", cls._become)
+
+        self.install_notifiers(registry)
+
+    def install_notifiers(self, registry):
+        """Start measuring the event dispatch of the notifiers in
+        ``registry`` that aren't measured yet, for example those enabled by
+        reloading the configuration.
+
+        :type registry: :class:`sagbescheid.notifier.NotifierRegistry`
+        """
+        for name, notifier in registry.notifiers.items():
+            if notifier in self._notifiers:
+                continue
+            self._notifiers.add(notifier)
+            for event_name in EVENTS + ["flapping"]:
+                setattr(notifier, event_name,
+                        self._timed("notifier " + name,
+                                    getattr(notifier, event_name)))
+
+    def summary(self):
+        """A one line summary for systemds status.
+
+        :rtype: str
+        """
+        return "{} signals, onSignal: {}".format(
+            self.signals, self._histogram("onSignal").summary())
+
+    def dump(self):
+        """Log all measurements.
+        """
+        logging.info("Received %d signals", self.signals)
+        for stage, histogram in sorted(self.stages.items()):
+            logging.info("%s: %s", stage, histogram.summary())
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2015, 2016, 2017, 2018 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+from .notifiers.ircnotifier import EVENT_MESSAGES, format_events
+from .unit import unit_name
+from .version import version
+from collections import OrderedDict
+from twisted.internet import reactor
+from twisted.words.protocols.irc import IRCClient
+
+
+class IRCNotifierBot(IRCClient):
+    versionName = "sagbescheid"
+    versionNum = version
+    # Lines aren't queued by IRCClient, but paced by _flush, so that events
+    # that haven't been sent yet can still be merged and are handed back to
+    # the factory if the connection is lost.
+    lineRate = None
+    # The minimum number of seconds between two lines sent to the channel.
+    line_interval = 1
+
+    @property
+    def nickname(self):
+        return self.factory.nick
+
+    def connectionMade(self):
+        IRCClient.connectionMade(self)
+        self._pending = OrderedDict((event_name, OrderedDict())
+                                    for event_name in EVENT_MESSAGES)
+        self._flush_call = None
+        self._last_line = None
+
+    def connectionLost(self, reason):
+        IRCClient.connectionLost(self, reason)
+        self.factory.client_lost(self)
+        if self._flush_call is not None and self._flush_call.active():
+            self._flush_call.cancel()
+        self._flush_call = None
+        # Give the events that haven't been sent back to the factory, so
+        # they're sent after reconnecting.
+        for event_name, events in self._pending.items():
+            for object_path, (queued_at, args) in events.items():
+                self.factory._buffer_event(event_name, object_path, args,
+                                           queued_at)
+            events.clear()
+
+    def signedOn(self):
+        self.factory.resetDelay()
+        self.join(self.factory.channel)
+
+    def joined(self, channel):
+        self.factory.client_ready(self)
+
+    def _msg_channel(self, msg):
+        """Send ``msg`` to the configured channel.
+
+        :type msg: str
+        """
+        self.msg(self.factory.channel, msg)
+        self._last_line = reactor.seconds()
+
+    def _max_message_length(self):
+        """Return the number of characters of a message that
+        :meth:`_msg_channel` sends in a single line.
+
+        :rtype: int
+        """
+        command = "PRIVMSG %s :" % self.factory.channel
+        # The same limit IRCClient.msg splits messages at, leaving enough room
+        # for the prefix added by the server in the 512 bytes an IRC line may
+        # have.
+        return self._safeMaximumLineLength(command) - len(command) - 2
+
+    def _add_event(self, event_name, object_path, args=()):
+        """Remember ``event_name`` for ``object_path`` until the next time
+        pending events are sent to the channel. If the event is already
+        pending for the unit, only its arguments are updated.
+
+        Other pending events of the unit are dropped, since lines are sent by
+        kind of event and not in the order the events arrived, only the latest
+        event of a unit is reported.
+
+        :type event_name: str
+        :type object_path: str
+        :type args: tuple
+        """
+        for other_name, other_events in self._pending.items():
+            if other_name != event_name:
+                other_events.pop(object_path, None)
+        events = self._pending[event_name]
+        if object_path in events:
+            queued_at = events[object_path][0]
+        else:
+            queued_at = reactor.seconds()
+        events[object_path] = (queued_at, args)
+        self._schedule_flush(self.factory.aggregation_interval)
+
+    def _schedule_flush(self, delay):
+        """Call :meth:`_flush` in ``delay`` seconds, but not earlier than
+        ``line_interval`` seconds after the last line, unless it's already
+        scheduled.
+
+        :type delay: float
+        """
+        if self._flush_call is not None:
+            return
+        if self._last_line is not None:
+            delay = max(delay, self._last_line + self.line_interval -
+                        reactor.seconds())
+        self._flush_call = reactor.callLater(delay, self._flush)
+
+    def _flush(self):
+        """Send the line for the first kind of event with pending events to
+        the channel, the lines for other kinds of events follow every
+        ``line_interval`` seconds.
+
+        Events arriving in the meantime are merged into the pending lines, so
+        no matter how many events arrive, there's at most one line per kind of
+        event waiting to be sent.
+        """
+        self._flush_call = None
+        for event_name, events in self._pending.items():
+            if events:
+                # Only used if the event is pending for a single unit.
+                _, args = next(iter(events.values()))
+                self._msg_channel(format_events(
+                    event_name, [unit_name(object_path)
+                                 for object_path in events],
+                    self._max_message_length(), args))
+                events.clear()
+                break
+        if any(self._pending.values()):
+            self._schedule_flush(self.line_interval)
+
+    def normal_start(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+        self._add_event("normal_start", object_path)
+
+    def normal_stop(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+        self._add_event("normal_stop", object_path)
+
+    def failure(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+        self._add_event("failure", object_path)
+
+    def ongoing_failure(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+        self._add_event("ongoing_failure", object_path)
+
+    def recovery(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+        self._add_event("recovery", object_path)
+
+    def change_from_unknown(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+        pass
+
+    def flapping(self, object_path, count, window, last_event):
+        """
+        :param self:
+        :param object_path:
+        :param count:
+        :param window:
+        :param last_event:
+        """
+        self._add_event("flapping", object_path, (count, window, last_event))
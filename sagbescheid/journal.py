@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Journals are traces of what sagbescheid received and emitted.
+
+A journal is a text file with one record per line, made up of four fields
+separated by tabs::
+
+    <unix timestamp> <kind> <object path> <value>
+
+``kind`` is ``signal`` for a ``PropertiesChanged`` signal, the value is the
+units new ``ActiveState`` then. For an event emitted by a unit, ``kind`` is
+``event`` and the value is the name of the event. Empty lines and lines
+starting with ``#`` are ignored.
+"""
+import logging
+import os
+
+
+from .unit import UNIT_IFACE
+from functools import wraps
+from time import time
+from twisted.internet import defer, reactor, task
+
+
+#: The kind of records of ``PropertiesChanged`` signals.
+SIGNAL = "signal"
+#: The kind of records of events emitted by units.
+EVENT = "event"
+
+# The number of buffered records that causes the buffer to be written out
+# before the flush interval is over.
+JOURNAL_BATCH_SIZE = 10000
+
+# The number of signals replayed before giving the reactor a chance to run
+# if a journal is replayed as fast as possible.
+REPLAY_BATCH_SIZE = 1000
+
+
+def parse_record(line):
+    """Return the timestamp, kind, object path and value of the record in
+    ``line``, or ``None`` if the line doesn't contain a record.
+
+    :type line: str
+    :rtype: (float, str, str, str)
+    :raises ValueError: If the line is malformed.
+    """
+    line = line.rstrip("\r\n")
+    if not line or line.startswith("#"):
+        return None
+    timestamp, kind, object_path, value = line.split("\t")
+    return float(timestamp), kind, object_path, value
+
+
+def read_journal(filename):
+    """Yield the records in the journal ``filename``. Malformed lines are
+    logged and skipped.
+
+    :type filename: str
+    """
+    with open(filename) as journal:
+        for number, line in enumerate(journal, 1):
+            try:
+                record = parse_record(line)
+            except ValueError:
+                logging.warning("%s:%d: Skipping malformed record %r",
+                                filename, number, line)
+                continue
+            if record is not None:
+                yield record
+
+
+def replay(records, on_signal, speed=0):
+    """Call ``on_signal`` with the object path and state of every signal in
+    ``records``.
+
+    :type records: iterable of (float, str, str, str)
+    :param on_signal: Called with ``object_path, active_state``.
+    :param speed: If greater than 0, signals are replayed at this multiple
+                  of the speed they have been recorded at, otherwise as fast
+                  as possible.
+    :type speed: float
+    :return: A :class:`twisted.internet.defer.Deferred` firing with the
+             number of replayed signals.
+    """
+    replayed = [0]
+
+    def iterate():
+        start = None
+        for timestamp, kind, object_path, value in records:
+            if kind != SIGNAL:
+                continue
+            if speed > 0:
+                if start is None:
+                    start = (timestamp, reactor.seconds())
+                delay = (start[1] + (timestamp - start[0]) / speed -
+                         reactor.seconds())
+                if delay > 0:
+                    yield task.deferLater(reactor, delay, lambda: None)
+            elif replayed[0] % REPLAY_BATCH_SIZE == 0:
+                yield None
+            on_signal(object_path, value)
+            replayed[0] += 1
+
+    d = task.cooperate(iterate()).whenDone()
+    d.addCallback(lambda _: replayed[0])
+    return d
+
+
+@defer.inlineCallbacks
+def wait_for_queues(registry, interval=0.1):
+    """Wait until the notifier queues of ``registry`` are empty.
+
+    :type registry: :class:`sagbescheid.notifier.NotifierRegistry`
+    :type interval: float
+    """
+    while any(queue.depth for queue in registry.queues.values()):
+        yield task.deferLater(reactor, interval, lambda: None)
+
+
+class JournalWriter(object):
+    """Appends records to a journal.
+
+    Recording a record only formats it and puts it into a buffer, which is
+    written to the file every ``flush_interval`` seconds, or as soon as it
+    holds :data:`JOURNAL_BATCH_SIZE` records. Once the file would grow
+    beyond ``max_size`` bytes, it is rotated like
+    :class:`logging.handlers.RotatingFileHandler` does, keeping ``backups``
+    old files named ``filename.1`` (the newest) to ``filename.<backups>``.
+    """
+
+    def __init__(self, filename, max_size, backups=5, flush_interval=1):
+        """
+        :type filename: str
+        :type max_size: int
+        :type backups: int
+        :type flush_interval: float
+        """
+        self.filename = filename
+        self.max_size = max_size
+        self.backups = backups
+        self.buffer = []
+        self._file = open(filename, "a")
+        self._call = None
+        self._loop = task.LoopingCall(self.flush)
+        self._loop.start(flush_interval, now=False)
+
+    def record(self, kind, object_path, value):
+        """
+        :type kind: str
+        :type object_path: str
+        :type value: str
+        """
+        self.buffer.append("%.6f\t%s\t%s\t%s\n" %
+                           (time(), kind, object_path, value))
+        if len(self.buffer) >= JOURNAL_BATCH_SIZE and self._call is None:
+            self._call = reactor.callLater(0, self.flush)
+
+    def flush(self):
+        """Write all buffered records to the file.
+        """
+        if self._call is not None:
+            if self._call.active():
+                self._call.cancel()
+            self._call = None
+        if not self.buffer:
+            return
+        data = "".join(self.buffer)
+        del self.buffer[:]
+        if 0 < self._file.tell() and \
+                self._file.tell() + len(data) > self.max_size:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = "%s.%d" % (self.filename, index)
+            if os.path.exists(source):
+                os.rename(source, "%s.%d" % (self.filename, index + 1))
+        if self.backups > 0:
+            os.rename(self.filename, self.filename + ".1")
+        else:
+            os.remove(self.filename)
+        self._file = open(self.filename, "a")
+
+    def close(self):
+        """Write all buffered records and close the file.
+        """
+        if self._loop.running:
+            self._loop.stop()
+        self.flush()
+        self._file.close()
+
+    def install(self, unit_classes, registry):
+        """Start recording the signals received by all ``unit_classes`` and
+        the events passed to ``registry``.
+
+        :type unit_classes: [:class:`sagbescheid.unit.BaseUnit`]
+        :type registry: :class:`sagbescheid.notifier.NotifierRegistry`
+        """
+        record = self.record
+
+        def recording_signals(func):
+            @wraps(func)
+            def wrapper(unit, iface, changed, invalidated):
+                if iface == UNIT_IFACE and "ActiveState" in changed:
+                    record(SIGNAL, unit.object_path, changed["ActiveState"])
+                return func(unit, iface, changed, invalidated)
+            return wrapper
+
+        for cls in unit_classes:
+            cls.onSignal = recording_signals(cls.onSignal)
+
+        handle_event = registry.handle_event
+
+        @wraps(handle_event)
+        def recording_events(object_path, event_name):
+            record(EVENT, object_path, event_name)
+            return handle_event(object_path, event_name)
+
+        registry.handle_event = recording_events
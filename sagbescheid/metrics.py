@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+
+class MetricsResource(Resource):
+    isLeaf = True
+
+    def __init__(self, notifier):
+        """
+        :param notifier: The notifier whose ``render()`` result is served.
+        """
+        Resource.__init__(self)
+        self.notifier = notifier
+
+    def render_GET(self, request):
+        request.setHeader(b"Content-Type",
+                          b"text/plain; version=0.0.4; charset=utf-8")
+        return self.notifier.render()
+
+
+def metrics_site(notifier):
+    """Return a site serving the metrics of ``notifier`` on ``/metrics``.
+
+    :param notifier: The notifier whose ``render()`` result is served.
+    :rtype: :class:`twisted.web.server.Site`
+    """
+    root = Resource()
+    root.putChild(b"metrics", MetricsResource(notifier))
+    return Site(root)
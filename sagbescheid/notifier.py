@@ -2,12 +2,27 @@
 # coding: utf-8
 # Copyright © 2015, 2017 Wieland Hoffmann
 # License: MIT, see LICENSE for details
+import logging
+
+
 from . import notifiers
 
+from .filters import compile_unit_filter
+from .unit import unit_name
+from collections import deque
+from twisted.internet import reactor
 from twisted.plugin import getPlugins
 from zope.interface import Attribute, Interface
 
 
+#: What to do with a new event if the queue of a notifier is full.
+OVERFLOW_POLICIES = ["drop-oldest", "coalesce", "block"]
+
+# The maximum number of events delivered to a single notifier per reactor
+# iteration.
+QUEUE_BATCH_SIZE = 100
+
+
 class INotifier(Interface):
     name = Attribute("The name of the notifier")
     description = Attribute("A description of the notifier")
@@ -24,6 +39,17 @@ class INotifier(Interface):
         :type: :class:`argparse.Namespace`
         """
 
+    def stop():
+        """Undo :meth:`handle_arguments`, closing connections and the like.
+
+        Called when the configuration is reloaded and the notifier is either
+        disabled or its arguments changed. In the latter case,
+        :meth:`handle_arguments` is called again afterwards.
+
+        :return: ``None`` or a :class:`twisted.internet.defer.Deferred`
+                 firing once the notifier stopped.
+        """
+
     def normal_start(self, object_path):
         """
         :param self:
@@ -66,15 +92,388 @@ class INotifier(Interface):
         """
         pass
 
+    def flapping(self, object_path, count, window, last_event):
+        """Called instead of the individual events if a unit changed its
+        state ``count`` times within ``window`` seconds.
+
+        :param self:
+        :param object_path:
+        :type count: int
+        :type window: float
+        :param last_event: The name of the most recent event.
+        :type last_event: str
+        """
+        pass
+
+
+class IUnitStateObserver(Interface):
+    """Notifiers providing this interface as well as :class:`INotifier` are
+    told about the state of every unit, not just about the events.
+
+    Unlike events, states are neither queued, suppressed nor routed.
+    """
+
+    def unit_state_changed(object_path, state):
+        """Called whenever the unit at ``object_path`` entered a new state,
+        including the first time it left ``unknown``.
+
+        :type object_path: str
+        :param state: The name of the state, see
+                      :attr:`sagbescheid.unit.BaseUnit.state`.
+        :type state: str
+        """
+
+    def unit_removed(object_path):
+        """Called when the unit at ``object_path`` isn't monitored anymore.
+
+        :type object_path: str
+        """
+
+
+#: The names of all events emitted by units.
+EVENTS = ["normal_start", "normal_stop", "failure", "ongoing_failure",
+          "recovery", "change_from_unknown"]
+
+
+class FlapSuppressor(object):
+    """Suppresses events of units that change their state too often.
+
+    An event with a configured window is passed on and opens a window whose
+    length depends on the events name. All events of the unit within the
+    window are suppressed, no matter whether they have a window themselves.
+    When the window closes, a single ``flapping`` event summarizes the events
+    within it.
+
+    State is only kept for units with an open window.
+    """
+
+    def __init__(self, windows, emit):
+        """
+        :param windows: The window length in seconds for each event name.
+                        Events without a window never open one, but are
+                        suppressed while one is open.
+        :type windows: {str: float}
+        :param emit: Called with ``object_path, "flapping", count, window,
+                     last_event`` when a window with suppressed events
+                     closes.
+        """
+        self.windows = windows
+        self.emit = emit
+        self.open_windows = {}
+
+    def admit(self, object_path, event_name):
+        """Return whether ``event_name`` for ``object_path`` should be passed
+        on to the notifiers.
+
+        :type object_path: str
+        :type event_name: str
+        :rtype: bool
+        """
+        state = self.open_windows.get(object_path)
+        if state is not None:
+            state[0] += 1
+            state[2] = event_name
+            return False
+
+        window = self.windows.get(event_name)
+        if window is not None:
+            call = reactor.callLater(window, self._close, object_path)
+            # The number of events, the window length, the last event and the
+            # DelayedCall closing the window.
+            self.open_windows[object_path] = [1, window, event_name, call]
+        return True
+
+    def _close(self, object_path):
+        """
+        :type object_path: str
+        """
+        count, window, last_event, _ = self.open_windows.pop(object_path)
+        if count > 1:
+            self.emit(object_path, "flapping", count, window, last_event)
+
+    def cancel(self):
+        """Close all open windows without emitting anything.
+        """
+        for _, _, _, call in self.open_windows.values():
+            call.cancel()
+        self.open_windows.clear()
+
+
+class NotifierQueue(object):
+    """A bounded queue of events for a single notifier.
+
+    Events are delivered to the notifier from the reactor loop, not from the
+    code putting them into the queue, so a slow or failing notifier can
+    neither delay other notifiers nor the processing of further signals.
+    """
+
+    def __init__(self, notifier, size, overflow="drop-oldest"):
+        """
+        :type notifier: :class:`sagbescheid.notifier.INotifier`
+        :param size: The maximum number of queued events.
+        :type size: int
+        :param overflow: One of :data:`OVERFLOW_POLICIES`.
+        :type overflow: str
+        """
+        self.notifier = notifier
+        self.size = size
+        self.overflow = overflow
+        self.events = deque()
+        self.dropped = 0
+        self.last_lag = 0.0
+        self._dropped_since_drain = 0
+        self._call = None
+
+    @property
+    def depth(self):
+        """The number of queued events.
+
+        :rtype: int
+        """
+        return len(self.events)
+
+    @property
+    def lag(self):
+        """The number of seconds the oldest queued event has been waiting.
+
+        :rtype: float
+        """
+        if not self.events:
+            return 0.0
+        return reactor.seconds() - self.events[0][0]
+
+    def put(self, object_path, event_name, *args):
+        """Queue ``event_name`` for ``object_path``.
+
+        :type object_path: str
+        :type event_name: str
+        :param args: Additional arguments for the event.
+        """
+        if len(self.events) >= self.size:
+            self._handle_overflow(object_path)
+        self.events.append((reactor.seconds(), object_path, event_name, args))
+        if self._call is None:
+            self._call = reactor.callLater(0, self._drain)
+
+    def _handle_overflow(self, object_path):
+        """Make room for a new event for ``object_path``.
+
+        :type object_path: str
+        """
+        if self.overflow == "block":
+            # There's no way to block in the reactor, so deliver the oldest
+            # event right away, at the expense of the caller.
+            self._deliver(*self.events.popleft())
+            return
+
+        if self.overflow == "coalesce":
+            # Only the newest event of a unit is interesting, so replace the
+            # oldest queued event for the same unit, if there is one.
+            for index, (_, queued_path, _, _) in enumerate(self.events):
+                if queued_path == object_path:
+                    del self.events[index]
+                    break
+            else:
+                self.events.popleft()
+        else:
+            self.events.popleft()
+        self.dropped += 1
+        self._dropped_since_drain += 1
+
+    def resize(self, size):
+        """Change the maximum number of queued events to ``size``. If more
+        events are queued, the overflow policy makes room for them.
+
+        :type size: int
+        """
+        self.size = size
+        while len(self.events) > size:
+            self._handle_overflow(None)
+
+    def _drain(self):
+        self._call = None
+        if self._dropped_since_drain:
+            logging.warning("The queue of the %s notifier is full, dropped %d "
+                            "events", self.notifier.name,
+                            self._dropped_since_drain)
+            self._dropped_since_drain = 0
+
+        for _ in range(min(len(self.events), QUEUE_BATCH_SIZE)):
+            self._deliver(*self.events.popleft())
+
+        if self.events:
+            self._call = reactor.callLater(0, self._drain)
+
+    def flush(self):
+        """Deliver all queued events right away.
+        """
+        if self._call is not None:
+            self._call.cancel()
+            self._call = None
+        while self.events:
+            self._deliver(*self.events.popleft())
+
+    def _deliver(self, queued_at, object_path, event_name, args):
+        """
+        :type queued_at: float
+        :type object_path: str
+        :type event_name: str
+        :type args: tuple
+        """
+        self.last_lag = reactor.seconds() - queued_at
+        try:
+            getattr(self.notifier, event_name)(object_path, *args)
+        except Exception:
+            logging.exception("The %s notifier failed to handle %s for %s:",
+                              self.notifier.name, event_name, object_path)
+
+
+class RoutingTable(object):
+    """Decides which notifiers an event is passed to.
+
+    Every route names a notifier, the events it gets (``None`` for all of
+    them) and the units it gets them for (``None`` for all of them).
+    Notifiers without any route get all events of all units.
+
+    The notifiers for an object path and event are only determined once and
+    then looked up in a dict, until :meth:`forget` is called for the object
+    path.
+    """
+
+    def __init__(self, routes, notifier_names):
+        """
+        :param routes: The routes, each made up of the name of a notifier, the
+                       names of the events and unit name patterns (see
+                       :func:`sagbescheid.filters.compile_unit_filter`).
+        :type routes: [(str, [str], [str])]
+        :param notifier_names: The names of the enabled notifiers, in the
+                               order events are passed to them.
+        :type notifier_names: [str]
+        """
+        self.notifier_names = list(notifier_names)
+        self.routes = {}
+        for notifier_name, event_names, patterns in routes:
+            if notifier_name not in self.notifier_names:
+                logging.warning("Ignoring the route for the %s notifier, it's "
+                                "not enabled", notifier_name)
+                continue
+            unit_filter = compile_unit_filter(include=patterns)
+            self.routes.setdefault(notifier_name, []).append(
+                (frozenset(event_names) if event_names else None,
+                 unit_filter))
+        self._cache = {}
+
+    def lookup(self, object_path, event_name):
+        """Return the names of the notifiers ``event_name`` for
+        ``object_path`` is passed to.
+
+        :type object_path: str
+        :type event_name: str
+        :rtype: (str,)
+        """
+        cached = self._cache.get(object_path)
+        if cached is None:
+            cached = self._cache[object_path] = {}
+        names = cached.get(event_name)
+        if names is None:
+            names = cached[event_name] = self._route(object_path, event_name)
+        return names
+
+    def forget(self, object_path):
+        """Drop the cached notifiers for ``object_path``.
+
+        :type object_path: str
+        """
+        self._cache.pop(object_path, None)
+
+    def _route(self, object_path, event_name):
+        """
+        :type object_path: str
+        :type event_name: str
+        :rtype: (str,)
+        """
+        name = unit_name(object_path)
+        result = []
+        for notifier_name in self.notifier_names:
+            routes = self.routes.get(notifier_name)
+            if routes is None or any(
+                    (event_names is None or event_name in event_names) and
+                    (unit_filter is None or unit_filter(name))
+                    for event_names, unit_filter in routes):
+                result.append(notifier_name)
+        return tuple(result)
+
 
 class NotifierRegistry(object):
-    def __init__(self, notifiers):
+    def __init__(self, notifiers, queue_size=0, overflow="drop-oldest",
+                 flap_windows=None, routes=None):
         """
         :type notifiers: [:class:`sagbescheid.notifier.INotifier`]
+        :param queue_size: If greater than 0, every notifier gets its own
+                           :class:`NotifierQueue` holding up to
+                           ``queue_size`` events. Otherwise, notifiers are
+                           called directly from :meth:`handle_event`.
+        :type queue_size: int
+        :param overflow: One of :data:`OVERFLOW_POLICIES`.
+        :type overflow: str
+        :param flap_windows: If set, events are passed through a
+                             :class:`FlapSuppressor` with these windows.
+        :type flap_windows: {str: float}
+        :param routes: If set, events are only passed to the notifiers a
+                       :class:`RoutingTable` with these routes returns.
+        :type routes: [(str, [str], [str])]
+        """
+        self.notifiers = {}
+        self.queues = {}
+        self.flap_suppressor = None
+        self.routing_table = None
+        self.configure(notifiers, queue_size, overflow, flap_windows, routes)
+
+    def configure(self, notifiers, queue_size=0, overflow="drop-oldest",
+                  flap_windows=None, routes=None):
+        """Change the notifiers and how events are passed to them, see
+        :meth:`__init__` for the arguments.
+
+        The queues of notifiers that remain enabled keep their events. Events
+        queued for notifiers that are disabled, or for all notifiers if the
+        queues are disabled, are delivered right away.
         """
+        names = [notifier.name for notifier in notifiers]
+        for name, queue in list(self.queues.items()):
+            if name not in names or queue_size <= 0:
+                queue.flush()
+                del self.queues[name]
+
         self.notifiers = {}
+        self.state_observers = []
         for notifier in notifiers:
             self.notifiers[notifier.name] = notifier
+            if IUnitStateObserver.providedBy(notifier):
+                self.state_observers.append(notifier)
+            if queue_size <= 0:
+                continue
+            queue = self.queues.get(notifier.name)
+            if queue is None or queue.notifier is not notifier:
+                self.queues[notifier.name] = NotifierQueue(notifier,
+                                                           queue_size,
+                                                           overflow)
+            else:
+                queue.overflow = overflow
+                queue.resize(queue_size)
+
+        if flap_windows:
+            if self.flap_suppressor is None:
+                self.flap_suppressor = FlapSuppressor(flap_windows,
+                                                      self.dispatch)
+            else:
+                self.flap_suppressor.windows = flap_windows
+        elif self.flap_suppressor is not None:
+            self.flap_suppressor.cancel()
+            self.flap_suppressor = None
+
+        self.routing_table = None
+        if routes:
+            self.routing_table = RoutingTable(routes, names)
 
     def handle_event(self, object_path, event_name):
         """
@@ -82,13 +481,80 @@ class NotifierRegistry(object):
         :param object_path:
         :param event_name:
         """
-        for notifier in self.notifiers.itervalues():
-            method = getattr(notifier, event_name)
-            method(object_path)
+        if (self.flap_suppressor is not None and
+                not self.flap_suppressor.admit(object_path, event_name)):
+            return
+        self.dispatch(object_path, event_name)
+
+    def dispatch(self, object_path, event_name, *args):
+        """Pass ``event_name`` to the notifiers, bypassing the flap
+        suppression.
+
+        :type object_path: str
+        :type event_name: str
+        :param args: Additional arguments for the event.
+        """
+        if self.routing_table is None:
+            names = self.notifiers
+        else:
+            names = self.routing_table.lookup(object_path, event_name)
+
+        if self.queues:
+            for name in names:
+                self.queues[name].put(object_path, event_name, *args)
+            return
+
+        for name in names:
+            method = getattr(self.notifiers[name], event_name)
+            method(object_path, *args)
+
+    def unit_state_changed(self, object_path, state):
+        """Tell all notifiers providing :class:`IUnitStateObserver` that the
+        unit at ``object_path`` entered ``state``.
+
+        :type object_path: str
+        :type state: str
+        """
+        for observer in self.state_observers:
+            observer.unit_state_changed(object_path, state)
+
+    def unit_removed(self, object_path):
+        """Tell all notifiers providing :class:`IUnitStateObserver` that the
+        unit at ``object_path`` isn't monitored anymore and forget everything
+        cached about it.
+
+        :type object_path: str
+        """
+        if self.routing_table is not None:
+            self.routing_table.forget(object_path)
+        for observer in self.state_observers:
+            observer.unit_removed(object_path)
+
+    def queue_stats(self):
+        """Return the depth, the current lag and the number of dropped events
+        of the queue of every notifier.
+
+        :rtype: {str: (int, float, int)}
+        """
+        return {name: (queue.depth, queue.lag, queue.dropped)
+                for name, queue in self.queues.items()}
+
+
+# The notifiers found by get_all_notifiers.
+_all_notifiers = []
 
 
 def get_all_notifiers():
-    return getPlugins(INotifier, notifiers)
+    """Return all available notifiers.
+
+    Discovering them imports every module in :mod:`sagbescheid.notifiers`,
+    so that only happens the first time this is called.
+
+    :rtype: [:class:`sagbescheid.notifier.INotifier`]
+    """
+    if not _all_notifiers:
+        _all_notifiers.extend(getPlugins(INotifier, notifiers))
+    return _all_notifiers
 
 
 def get_enabled_notifiers(enabled_notifier_names):
@@ -102,6 +568,8 @@ def get_enabled_notifiers(enabled_notifier_names):
 
     for notifier in enabled_notifier_names:
         notifier_plugin = available_notifier_name_map[notifier]
-        notifiers_to_activate.append(notifier_plugin)
+        # A notifier enabled twice is still only set up once.
+        if notifier_plugin not in notifiers_to_activate:
+            notifiers_to_activate.append(notifier_plugin)
 
     return notifiers_to_activate
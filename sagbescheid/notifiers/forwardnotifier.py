@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import socket
+
+
+from ..argparse_ext import secret_file
+from ..notifier import INotifier, IUnitStateObserver
+from functools import wraps
+from twisted.internet import reactor
+from twisted.plugin import IPlugin
+from zope.interface.declarations import implementer
+
+
+def passthrough_to_factory(func):
+    """
+    :param func:
+    """
+    @wraps(func)
+    def wrapper(self, object_path, *args):
+        self.factory.send(object_path, func.__name__, *args)
+
+    return wrapper
+
+
+@implementer(IPlugin, INotifier, IUnitStateObserver)
+class ForwardNotifier(object):
+    name = "forward"
+    description = "Forward events to a sagbescheid-collector"
+
+    def add_arguments(self, group):
+        group.add_argument("--forward-host", action="store",
+                           help="The host the collector is running on")
+        group.add_argument("--forward-port", action="store", type=int,
+                           default=9734,
+                           help="The port the collector is listening on")
+        group.add_argument("--forward-name", action="store",
+                           default=socket.gethostname(),
+                           help="The name of this host, as shown by the "
+                           "collector")
+        group.add_argument("--forward-batch-interval", action="store",
+                           type=float, default=0.5,
+                           help="The number of seconds events are collected "
+                           "before they're sent to the collector together.")
+        group.add_argument("--forward-batch-max", action="store", type=int,
+                           default=1000,
+                           help="The maximum number of events sent to the "
+                           "collector together.")
+        group.add_argument("--forward-spool", action="store", metavar="FILE",
+                           help="Keep events in this file while the "
+                           "collector is unreachable, instead of in memory.")
+        group.add_argument("--forward-spool-max-size", action="store",
+                           type=int, default=100,
+                           help="The maximum size of the kept events, in "
+                           "MiB.")
+        group.add_argument("--forward-secret-file", action="store",
+                           type=secret_file, metavar="FILE",
+                           help="Send the secret in this file to the "
+                           "collector, see --secret-file of "
+                           "sagbescheid-collector.")
+
+    def handle_arguments(self, args):
+        # Imported here so that discovering the notifier doesn't import the
+        # protocol.
+        from ..forwarding import ForwardingFactory, Spool
+        spool = Spool(args.forward_spool,
+                      args.forward_spool_max_size * 1024 * 1024)
+        self.factory = ForwardingFactory(args.forward_name,
+                                         args.forward_batch_interval,
+                                         args.forward_batch_max, spool,
+                                         args.forward_secret_file)
+        self.factory.connector = reactor.connectTCP(args.forward_host,
+                                                    args.forward_port,
+                                                    self.factory)
+        self._shutdown_trigger = reactor.addSystemEventTrigger(
+            "before", "shutdown", self.factory.flush)
+
+    def stop(self):
+        reactor.removeSystemEventTrigger(self._shutdown_trigger)
+        self.factory.stop()
+
+    def unit_state_changed(self, object_path, state):
+        self.factory.send(object_path, "unit_state_changed", state)
+
+    def unit_removed(self, object_path):
+        self.factory.send(object_path, "unit_removed")
+
+    @passthrough_to_factory
+    def normal_start(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+
+    @passthrough_to_factory
+    def normal_stop(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+
+    @passthrough_to_factory
+    def failure(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+
+    @passthrough_to_factory
+    def ongoing_failure(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+
+    @passthrough_to_factory
+    def recovery(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+
+    @passthrough_to_factory
+    def change_from_unknown(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+
+    @passthrough_to_factory
+    def flapping(self, object_path, count, window, last_event):
+        """
+        :param self:
+        :param object_path:
+        :param count:
+        :param window:
+        :param last_event:
+        """
+
+
+obj = ForwardNotifier()
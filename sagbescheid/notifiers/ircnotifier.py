@@ -2,12 +2,14 @@
 # coding: utf-8
 # Copyright © 2015, 2016, 2017, 2018 Wieland Hoffmann
 # License: MIT, see LICENSE for details
+import logging
+
+
 from ..notifier import INotifier
-from ..version import version
+from collections import deque, OrderedDict
 from functools import wraps
 from twisted.internet import protocol, reactor
 from twisted.plugin import IPlugin
-from twisted.words.protocols.irc import IRCClient
 from zope.interface.declarations import implementer
 
 
@@ -16,76 +18,67 @@ def passthrough_to_client(func):
     :param func:
     """
     @wraps(func)
-    def wrapper(self, object_path):
+    def wrapper(self, object_path, *args):
         client = self.prot
         event_name = func.__name__
+        if client is None:
+            self._buffer_event(event_name, object_path, args)
+            return
         method = getattr(client, event_name)
-        method(object_path)
+        method(object_path, *args)
 
     return wrapper
 
 
-class IRCNotifierBot(IRCClient):
-    versionName = "sagbescheid"
-    versionNum = version
-    lineRate = 1
-
-    @property
-    def nickname(self):
-        return self.factory.nick
-
-    def signedOn(self):
-        self.factory.resetDelay()
-        self.join(self.factory.channel)
-
-    def _msg_channel(self, msg):
-        """Send ``msg`` to the configured channel.
-
-        :type msg: str
-        """
-        self.msg(self.factory.channel, msg)
-
-    def normal_start(self, object_path):
-        """
-        :param self:
-        :param object_path:
-        """
-        self._msg_channel("%s started normally." % object_path)
-
-    def normal_stop(self, object_path):
-        """
-        :param self:
-        :param object_path:
-        """
-        self._msg_channel("%s stopped normally." % object_path)
-
-    def failure(self, object_path):
-        """
-        :param self:
-        :param object_path:
-        """
-        self._msg_channel("%s failed." % object_path)
-
-    def ongoing_failure(self, object_path):
-        """
-        :param self:
-        :param object_path:
-        """
-        self._msg_channel("%s is still failing." % object_path)
-
-    def recovery(self, object_path):
-        """
-        :param self:
-        :param object_path:
-        """
-        self._msg_channel("%s recovered." % object_path)
-
-    def change_from_unknown(self, object_path):
-        """
-        :param self:
-        :param object_path:
-        """
-        pass
+# How events are described in a channel message, for a single unit and for
+# multiple units. The message for a single unit is formatted with the name of
+# the unit and the arguments of the event.
+EVENT_MESSAGES = OrderedDict([
+    ("failure", ("%s failed.", "failed")),
+    ("ongoing_failure", ("%s is still failing.", "still failing")),
+    ("flapping", ("%s flapped %d times in %gs, the last event was %s.",
+                  "flapping")),
+    ("recovery", ("%s recovered.", "recovered")),
+    ("normal_start", ("%s started normally.", "started normally")),
+    ("normal_stop", ("%s stopped normally.", "stopped normally")),
+])
+
+
+def format_events(event_name, object_paths, max_length, args=()):
+    """Describe ``event_name`` happening to all ``object_paths`` in a single
+    line of at most ``max_length`` characters. Units that don't fit are only
+    counted.
+
+    :type event_name: str
+    :type object_paths: [str]
+    :type max_length: int
+    :param args: The arguments of the event, if it happened to a single unit.
+    :type args: tuple
+    :rtype: str
+    """
+    single, multiple = EVENT_MESSAGES[event_name]
+    if len(object_paths) == 1:
+        return single % ((object_paths[0],) + tuple(args))
+
+    prefix = multiple + ": "
+    length = len(prefix)
+    shown = []
+    for index, object_path in enumerate(object_paths):
+        remaining = len(object_paths) - index - 1
+        suffix = ", +%d more" % remaining if remaining else ""
+        separator = ", " if shown else ""
+        if (length + len(separator) + len(object_path) + len(suffix) >
+                max_length):
+            break
+        shown.append(object_path)
+        length += len(separator) + len(object_path)
+
+    line = prefix + ", ".join(shown)
+    if len(shown) < len(object_paths):
+        if shown:
+            line += ", "
+        line += "+%d more" % (len(object_paths) - len(shown))
+    return line
 
 
 @implementer(IPlugin, INotifier)
@@ -93,7 +86,11 @@ class IRCNotifierFactory(protocol.ReconnectingClientFactory):
     name = "irc"
     description = "Log events to an IRC channel"
 
-    protocol = IRCNotifierBot
+    def __init__(self):
+        # The client that has joined the channel, if any.
+        self.prot = None
+        self._buffer = deque()
+        self._buffer_dropped = 0
 
     def add_arguments(self, group):
         group.add_argument("--irc-nick", action="store",
@@ -104,17 +101,98 @@ class IRCNotifierFactory(protocol.ReconnectingClientFactory):
                            help="IRC server address")
         group.add_argument("--irc-port", action="store", type=int, default=6667,
                            help="IRC server port")
+        group.add_argument("--irc-aggregation-interval", action="store",
+                           type=float, default=1,
+                           help="The number of seconds events are collected "
+                           "before they're sent to the channel, merged into "
+                           "one line per kind of event.")
+        group.add_argument("--irc-buffer-size", action="store", type=int,
+                           default=1000,
+                           help="The maximum number of events to keep while "
+                           "not connected to the channel.")
+        group.add_argument("--irc-buffer-max-age", action="store", type=float,
+                           default=3600,
+                           help="The maximum age in seconds of events sent "
+                           "after (re)connecting to the channel.")
 
     def handle_arguments(self, args):
         self.channel = args.irc_channel
         self.nick = args.irc_nick
         self.port = args.irc_port
         self.server = args.irc_server
-        reactor.connectTCP(self.server, self.port, self)
-
-    def buildProtocol(self, addr):
-        self.prot = protocol.ReconnectingClientFactory.buildProtocol(self, addr)
-        return self.prot
+        self.aggregation_interval = args.irc_aggregation_interval
+        self.buffer_max_age = args.irc_buffer_max_age
+        self._buffer = deque(self._buffer, maxlen=args.irc_buffer_size)
+        # Imported here so that discovering the notifier doesn't import
+        # twisted.words.
+        from ..irc import IRCNotifierBot
+        self.protocol = IRCNotifierBot
+        self.continueTrying = True
+        self.resetDelay()
+        self.connector = reactor.connectTCP(self.server, self.port, self)
+
+    def stop(self):
+        connector = self.connector
+        self.stopTrying()
+        # Don't reconnect when the connection is lost.
+        self.connector = None
+        connector.disconnect()
+
+    def clientConnectionLost(self, connector, reason):
+        if connector is self.connector:
+            protocol.ReconnectingClientFactory.clientConnectionLost(
+                self, connector, reason)
+
+    def clientConnectionFailed(self, connector, reason):
+        if connector is self.connector:
+            protocol.ReconnectingClientFactory.clientConnectionFailed(
+                self, connector, reason)
+
+    def _buffer_event(self, event_name, object_path, args, queued_at=None):
+        """Keep an event that arrived while no client is in the channel.
+
+        :type event_name: str
+        :type object_path: str
+        :type args: tuple
+        :param queued_at: When the event arrived, defaults to now.
+        :type queued_at: float
+        """
+        if event_name not in EVENT_MESSAGES:
+            # The bot ignores it anyway.
+            return
+        if len(self._buffer) == self._buffer.maxlen:
+            self._buffer_dropped += 1
+        if queued_at is None:
+            queued_at = reactor.seconds()
+        self._buffer.append((queued_at, event_name, object_path, args))
+
+    def client_ready(self, client):
+        """Called when ``client`` has joined the channel. Passes all buffered
+        events that aren't too old to it.
+
+        :type client: :class:`sagbescheid.irc.IRCNotifierBot`
+        """
+        self.prot = client
+        now = reactor.seconds()
+        expired = 0
+        while self._buffer:
+            queued_at, event_name, object_path, args = self._buffer.popleft()
+            if now - queued_at > self.buffer_max_age:
+                expired += 1
+                continue
+            getattr(client, event_name)(object_path, *args)
+        if expired or self._buffer_dropped:
+            logging.warning("Dropped %d events while not connected to IRC",
+                            expired + self._buffer_dropped)
+        self._buffer_dropped = 0
+
+    def client_lost(self, client):
+        """Called when ``client`` lost its connection.
+
+        :type client: :class:`sagbescheid.irc.IRCNotifierBot`
+        """
+        if self.prot is client:
+            self.prot = None
 
     @passthrough_to_client
     def normal_start(self, object_path):
@@ -158,5 +236,15 @@ class IRCNotifierFactory(protocol.ReconnectingClientFactory):
         :param object_path:
         """
 
+    @passthrough_to_client
+    def flapping(self, object_path, count, window, last_event):
+        """
+        :param self:
+        :param object_path:
+        :param count:
+        :param window:
+        :param last_event:
+        """
+
 
 obj = IRCNotifierFactory()
@@ -6,6 +6,7 @@ import logging
 
 
 from ..notifier import INotifier
+from ..unit import unit_name
 from twisted.plugin import IPlugin
 from zope.interface.declarations import implementer
 
@@ -27,40 +28,43 @@ class LoggingNotifier(object):
         level = getattr(logging, args.logging_level.upper())
         logging.basicConfig(level=level)
 
+    def stop(self):
+        pass
+
     def normal_start(self, object_path):
         """
         :param self:
         :param object_path:
         """
-        logging.info("%s started normally.", object_path)
+        logging.info("%s started normally.", unit_name(object_path))
 
     def normal_stop(self, object_path):
         """
         :param self:
         :param object_path:
         """
-        logging.info("%s stopped normally.", object_path)
+        logging.info("%s stopped normally.", unit_name(object_path))
 
     def failure(self, object_path):
         """
         :param self:
         :param object_path:
         """
-        logging.info("%s failed.", object_path)
+        logging.info("%s failed.", unit_name(object_path))
 
     def ongoing_failure(self, object_path):
         """
         :param self:
         :param object_path:
         """
-        logging.info("%s is still failing.", object_path)
+        logging.info("%s is still failing.", unit_name(object_path))
 
     def recovery(self, object_path):
         """
         :param self:
         :param object_path:
         """
-        logging.info("%s recovered.", object_path)
+        logging.info("%s recovered.", unit_name(object_path))
 
     def change_from_unknown(self, object_path):
         """
@@ -69,5 +73,16 @@ class LoggingNotifier(object):
         """
         pass
 
+    def flapping(self, object_path, count, window, last_event):
+        """
+        :param self:
+        :param object_path:
+        :param count:
+        :param window:
+        :param last_event:
+        """
+        logging.info("%s flapped %d times in %gs, the last event was %s.",
+                     unit_name(object_path), count, window, last_event)
+
 
 obj = LoggingNotifier()
@@ -2,10 +2,13 @@
 # coding: utf-8
 # Copyright © 2015, 2017, 2018, 2019 Wieland Hoffmann
 # License: MIT, see LICENSE for details
+import logging
+
+
 from ..notifier import INotifier
-from email.mime.text import MIMEText
+from ..unit import unit_name
 from six import StringIO
-from twisted.mail.smtp import (messageid, sendmail)
+from twisted.internet import reactor
 from twisted.plugin import IPlugin
 from zope.interface.declarations import implementer
 
@@ -13,7 +16,7 @@ from zope.interface.declarations import implementer
 @implementer(IPlugin, INotifier)
 class SMTPNotifier(object):
     name = "smtp"
-    description = "Send notification emails via twisted.mail.smtp.sendmail"
+    description = "Send notification emails via SMTP"
 
     def add_arguments(self, group):
         group.add_argument("--smtp-from", action="store",
@@ -33,6 +36,20 @@ class SMTPNotifier(object):
         group.add_argument("--smtp-require-transport-security",
                            action="store_true", default=False,
                            help="Require STARTTLS")
+        group.add_argument("--smtp-batch-window", action="store", type=float,
+                           default=0,
+                           help="Collect the events of this many seconds "
+                           "into a single digest email. 0 sends one email per "
+                           "event.")
+        group.add_argument("--smtp-batch-max", action="store", type=int,
+                           default=100,
+                           help="The maximum number of events in a digest "
+                           "email.")
+        group.add_argument("--smtp-idle-timeout", action="store", type=float,
+                           default=10,
+                           help="The number of seconds to keep an idle "
+                           "connection to the SMTP server open for further "
+                           "emails.")
 
     def handle_arguments(self, args):
         self.from_ = args.smtp_from
@@ -43,28 +60,87 @@ class SMTPNotifier(object):
         self.port = args.smtp_port
         self.auth = args.smtp_require_authentication
         self.transport_sec = args.smtp_require_transport_security
+        self.batch_window = args.smtp_batch_window
+        self.batch_max = args.smtp_batch_max
+        self._batch = []
+        self._batch_call = None
+        # Imported here so that discovering the notifier doesn't import
+        # twisted.mail.
+        from ..smtp import PersistentSMTPFactory
+        self.factory = PersistentSMTPFactory(
+            self.host, self.port, self.from_, self.to, self.user,
+            self.password, self.auth, self.transport_sec,
+            args.smtp_idle_timeout)
+        self._shutdown_trigger = None
+        if self.batch_window > 0:
+            self._shutdown_trigger = reactor.addSystemEventTrigger(
+                "before", "shutdown", self._flush)
 
-    def _build_message_file(self, msg):
+    def stop(self):
+        # The connection to the SMTP server, if any, is closed once it has
+        # been idle for long enough.
+        self._flush()
+        if self._shutdown_trigger is not None:
+            reactor.removeSystemEventTrigger(self._shutdown_trigger)
+            self._shutdown_trigger = None
+
+    def _build_message_file(self, msg,
+                            subject="sagbescheid service notification"):
         """
         :type msg: str
+        :type subject: str
         """
+        from email.mime.text import MIMEText
+        from twisted.mail.smtp import messageid
         msg = msg
         message = MIMEText(msg, _subtype='plain', _charset='utf-8')
-        message['Subject'] = "sagbescheid service notification"
+        message['Subject'] = subject
         message['From'] = self.from_
         message['To'] = self.to
         message['Message-ID'] = messageid()
         return StringIO(message.as_string())
 
     def _send_mail(self, msg):
-        """
+        """Send ``msg``, either right away or as part of the next digest.
+
         :type msg: str
         """
-        message = self._build_message_file(msg)
-        sendmail(self.host, self.from_, [self.to], message, port=self.port,
-                 username=self.user, password=self.password,
-                 requireAuthentication=self.auth,
-                 requireTransportSecurity=self.transport_sec)
+        if self.batch_window <= 0:
+            return self._deliver(self._build_message_file(msg))
+
+        self._batch.append(msg)
+        if len(self._batch) >= self.batch_max:
+            self._flush()
+        elif self._batch_call is None:
+            self._batch_call = reactor.callLater(self.batch_window,
+                                                 self._flush)
+
+    def _flush(self):
+        """Send all collected messages as one digest email.
+        """
+        if self._batch_call is not None and self._batch_call.active():
+            self._batch_call.cancel()
+        self._batch_call = None
+        if not self._batch:
+            return
+        messages, self._batch = self._batch, []
+        if len(messages) == 1:
+            message = self._build_message_file(messages[0])
+        else:
+            message = self._build_message_file(
+                "\n".join(messages),
+                "sagbescheid service notifications ({} events)".format(
+                    len(messages)))
+        return self._deliver(message)
+
+    def _deliver(self, message):
+        """
+        :type message: file
+        """
+        d = self.factory.send(message)
+        d.addErrback(lambda failure: logging.error(
+            "Sending an email failed: %s", failure.getErrorMessage()))
+        return d
 
     def normal_start(self, object_path):
         """
@@ -85,21 +161,21 @@ class SMTPNotifier(object):
         :param self:
         :param object_path:
         """
-        self._send_mail("%s failed." % object_path)
+        self._send_mail("%s failed." % unit_name(object_path))
 
     def ongoing_failure(self, object_path):
         """
         :param self:
         :param object_path:
         """
-        self._send_mail("%s is still failing." % object_path)
+        self._send_mail("%s is still failing." % unit_name(object_path))
 
     def recovery(self, object_path):
         """
         :param self:
         :param object_path:
         """
-        self._send_mail("%s recovered." % object_path)
+        self._send_mail("%s recovered." % unit_name(object_path))
 
     def change_from_unknown(self, object_path):
         """
@@ -108,5 +184,16 @@ class SMTPNotifier(object):
         """
         pass
 
+    def flapping(self, object_path, count, window, last_event):
+        """
+        :param self:
+        :param object_path:
+        :param count:
+        :param window:
+        :param last_event:
+        """
+        self._send_mail("%s flapped %d times in %gs, the last event was %s." %
+                        (unit_name(object_path), count, window, last_event))
+
 
 sendmailnotifier = SMTPNotifier()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+from ..notifier import EVENTS, INotifier, IUnitStateObserver
+from ..unit import unit_name
+from twisted.internet import reactor
+from twisted.plugin import IPlugin
+from zope.interface.declarations import implementer
+
+
+def escape_label_value(value):
+    """
+    :type value: str
+    :rtype: str
+    """
+    return (value.replace("\\", "\\\\")
+                 .replace("\"", "\\\"")
+                 .replace("\n", "\\n"))
+
+
+@implementer(IPlugin, INotifier, IUnitStateObserver)
+class PrometheusNotifier(object):
+    name = "prometheus"
+    description = "Export event counters and unit states on a /metrics HTTP " \
+                  "endpoint for Prometheus"
+
+    def __init__(self):
+        self.event_counts = dict.fromkeys(EVENTS + ["flapping"], 0)
+        self.unit_states = {}
+        self._rendered = None
+
+    def add_arguments(self, group):
+        group.add_argument("--prometheus-port", action="store", type=int,
+                           default=9733,
+                           help="The port to serve /metrics on")
+        group.add_argument("--prometheus-interface", action="store",
+                           default="127.0.0.1",
+                           help="The address to serve /metrics on")
+
+    def handle_arguments(self, args):
+        # Imported here so that discovering the notifier doesn't import
+        # twisted.web.
+        from ..metrics import metrics_site
+        # Units that were removed while the notifier was disabled would stay
+        # around forever, the current states are reported again.
+        self.unit_states = {}
+        self._rendered = None
+        self._port = reactor.listenTCP(args.prometheus_port,
+                                       metrics_site(self),
+                                       interface=args.prometheus_interface)
+
+    def stop(self):
+        return self._port.stopListening()
+
+    def _record(self, object_path, event_name):
+        """
+        :type object_path: str
+        :type event_name: str
+        """
+        self.event_counts[event_name] += 1
+        self._rendered = None
+
+    def unit_state_changed(self, object_path, state):
+        self.unit_states[object_path] = state
+        self._rendered = None
+
+    def unit_removed(self, object_path):
+        if self.unit_states.pop(object_path, None) is not None:
+            self._rendered = None
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format. The
+        result is cached until the next event or state change.
+
+        :rtype: bytes
+        """
+        if self._rendered is not None:
+            return self._rendered
+
+        lines = [
+            "# HELP sagbescheid_events_total The number of events emitted "
+            "by units.",
+            "# TYPE sagbescheid_events_total counter",
+        ]
+        for event_name, count in sorted(self.event_counts.items()):
+            lines.append('sagbescheid_events_total{event="%s"} %d' %
+                         (event_name, count))
+        lines.extend([
+            "# HELP sagbescheid_unit_state The current state of a unit.",
+            "# TYPE sagbescheid_unit_state gauge",
+        ])
+        for object_path, state in sorted(self.unit_states.items()):
+            lines.append('sagbescheid_unit_state{unit="%s",state="%s"} 1' %
+                         (escape_label_value(unit_name(object_path)), state))
+        self._rendered = ("\n".join(lines) + "\n").encode("utf-8")
+        return self._rendered
+
+    def normal_start(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+        self._record(object_path, "normal_start")
+
+    def normal_stop(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+        self._record(object_path, "normal_stop")
+
+    def failure(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+        self._record(object_path, "failure")
+
+    def ongoing_failure(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+        self._record(object_path, "ongoing_failure")
+
+    def recovery(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+        self._record(object_path, "recovery")
+
+    def change_from_unknown(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+        self._record(object_path, "change_from_unknown")
+
+    def flapping(self, object_path, count, window, last_event):
+        """
+        :param self:
+        :param object_path:
+        :param count:
+        :param window:
+        :param last_event:
+        """
+        self._record(object_path, "flapping")
+
+
+obj = PrometheusNotifier()
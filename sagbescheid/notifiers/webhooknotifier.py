@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import time
+
+
+from ..argparse_ext import http_header, positive_int
+from ..notifier import INotifier
+from ..unit import unit_name
+from functools import wraps
+from twisted.internet import reactor
+from twisted.plugin import IPlugin
+from zope.interface.declarations import implementer
+
+
+def passthrough_to_sender(func):
+    """
+    :param func:
+    """
+    @wraps(func)
+    def wrapper(self, object_path, *args):
+        event = {"unit": unit_name(object_path),
+                 "object_path": object_path,
+                 "event": func.__name__,
+                 "time": time.time()}
+        event.update(func(self, object_path, *args) or {})
+        self.sender.send(event)
+
+    return wrapper
+
+
+@implementer(IPlugin, INotifier)
+class WebhookNotifier(object):
+    name = "webhook"
+    description = "POST events as JSON to an HTTP endpoint"
+
+    def add_arguments(self, group):
+        group.add_argument("--webhook-url", action="store",
+                           help="The URL to POST events to")
+        group.add_argument("--webhook-header", action="append", default=[],
+                           type=http_header, metavar="NAME: VALUE",
+                           help="An additional header to send, for example "
+                           "for authentication.")
+        group.add_argument("--webhook-flush-interval", action="store",
+                           type=float, default=1,
+                           help="The number of seconds events are collected "
+                           "before they're sent in a single request.")
+        group.add_argument("--webhook-batch-max", action="store",
+                           type=positive_int, default=100,
+                           help="The maximum number of events sent in a "
+                           "single request.")
+        group.add_argument("--webhook-queue-size", action="store",
+                           type=positive_int, default=10000,
+                           help="The maximum number of events kept while the "
+                           "endpoint is unreachable. The oldest ones are "
+                           "dropped first.")
+        group.add_argument("--webhook-max-retry-delay", action="store",
+                           type=float, default=300,
+                           help="Failed requests are retried after a delay "
+                           "that doubles with every failure, up to this many "
+                           "seconds.")
+        group.add_argument("--webhook-timeout", action="store", type=float,
+                           default=10,
+                           help="The number of seconds to wait for the "
+                           "endpoint to respond.")
+
+    def handle_arguments(self, args):
+        # Imported here so that discovering the notifier doesn't import
+        # twisted.web.
+        from ..webhook import WebhookSender
+        self.sender = WebhookSender(args.webhook_url,
+                                    args.webhook_flush_interval,
+                                    args.webhook_batch_max,
+                                    args.webhook_queue_size,
+                                    args.webhook_max_retry_delay,
+                                    args.webhook_timeout,
+                                    args.webhook_header)
+        self._shutdown_trigger = reactor.addSystemEventTrigger(
+            "before", "shutdown", self.sender.stop)
+
+    def stop(self):
+        reactor.removeSystemEventTrigger(self._shutdown_trigger)
+        return self.sender.stop()
+
+    @passthrough_to_sender
+    def normal_start(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+
+    @passthrough_to_sender
+    def normal_stop(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+
+    @passthrough_to_sender
+    def failure(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+
+    @passthrough_to_sender
+    def ongoing_failure(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+
+    @passthrough_to_sender
+    def recovery(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+
+    def change_from_unknown(self, object_path):
+        """
+        :param self:
+        :param object_path:
+        """
+        # Every unit changes from unknown on startup, that's not worth a
+        # request.
+        pass
+
+    @passthrough_to_sender
+    def flapping(self, object_path, count, window, last_event):
+        """
+        :param self:
+        :param object_path:
+        :param count:
+        :param window:
+        :param last_event:
+        """
+        return {"count": count, "window": window, "last_event": last_event}
+
+
+obj = WebhookNotifier()
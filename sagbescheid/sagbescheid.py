@@ -4,14 +4,25 @@
 # License: MIT, see LICENSE for details
 import argparse
 import logging
+import signal
 
-from .argparse_ext import TestAction
-from .notifier import get_all_notifiers, get_enabled_notifiers, NotifierRegistry
-from .unit import get_all_unit_paths, Unit, UNIT_IFACE
+from .argparse_ext import (event_window, positive_int, route, TestAction,
+                           unit_pattern)
+from .config import (changed_options, ConfigArgumentParser, parse_arguments,
+                     RecordingGroup)
+from .dispatcher import SignalDispatcher
+from .filters import compile_unit_filter
+from .instrumentation import Instrumentation
+from .journal import JournalWriter, read_journal, replay, wait_for_queues
+from .notifier import (get_all_notifiers, get_enabled_notifiers,
+                       NotifierRegistry, OVERFLOW_POLICIES)
+from .snapshot import load_snapshot, save_snapshot
+from .tracker import UnitTracker
+from .unit import get_all_units, seed_units, TableUnit, Unit, UNIT_IFACE
 from functools import partial
 from operator import attrgetter
-from sys import exit
-from twisted.internet import defer, reactor
+from sys import argv, exit
+from twisted.internet import defer, reactor, task
 from twisted.python import log
 from txdbus import client, error
 
@@ -23,7 +34,7 @@ try:
         """
         notify("READY=1")
 
-    def systemd_status(message):
+    def _systemd_status(message):
         """Send a status `message` to systemd.
 
         :type message: str
@@ -37,7 +48,7 @@ except ImportError:
         """
         pass
 
-    def systemd_status(message):
+    def _systemd_status(message):
         """Send a status `message` to systemd.
 
         :type message: str
@@ -45,34 +56,348 @@ except ImportError:
         pass
 
 
+# The last status message and the instrumentation, if it's enabled.
+_status = {"message": "", "instrumentation": None}
+
+# The destinations of the arguments of every notifier, by notifier name.
+_notifier_dests = {}
+
+# Options that only take effect after a restart, not on reloads.
+RESTART_OPTIONS = ["shared_match_rule", "track_units", "fast_transitions",
+                   "instrument", "instrument_interval", "journal",
+                   "journal_max_size", "journal_backups",
+                   "journal_flush_interval", "state_file",
+                   "state_save_interval"]
+
+
+def systemd_status(message):
+    """Send a status `message` to systemd, followed by a summary of the
+    instrumentation data if instrumentation is enabled.
+
+    :type message: str
+    """
+    _status["message"] = message
+    instrumentation = _status["instrumentation"]
+    if instrumentation is not None:
+        message = "{} {}".format(message, instrumentation.summary())
+    _systemd_status(message)
+
+
+def enable_instrumentation(registry, interval):
+    """Measure the signal processing and report it in systemds status every
+    ``interval`` seconds and in the log on SIGUSR1.
+
+    :type registry: :class:`sagbescheid.notifier.NotifierRegistry`
+    :type interval: float
+    """
+    instrumentation = Instrumentation()
+    instrumentation.install([Unit, TableUnit], registry)
+    _status["instrumentation"] = instrumentation
+    task.LoopingCall(lambda: systemd_status(_status["message"])).start(
+        interval, now=False)
+    signal.signal(signal.SIGUSR1,
+                  lambda signum, frame: reactor.callFromThread(
+                      instrumentation.dump))
+
+
+def build_registry(args, notifiers=None):
+    """
+    :type args: :class:`argparse.Namespace`
+    :param notifiers: The notifiers to use instead of the ones enabled in
+                      ``args``.
+    :type notifiers: [:class:`sagbescheid.notifier.INotifier`]
+    :rtype: :class:`sagbescheid.notifier.NotifierRegistry`
+    """
+    if notifiers is None:
+        notifiers = get_enabled_notifiers(args.notifier)
+    registry = NotifierRegistry(notifiers,
+                                args.notifier_queue_size,
+                                args.notifier_overflow,
+                                dict(args.flap_window),
+                                args.route)
+    # Always started, a reload may enable the queues.
+    task.LoopingCall(log_queue_stats, registry).start(60, now=False)
+    if args.instrument:
+        enable_instrumentation(registry, args.instrument_interval)
+    if args.journal:
+        journal = JournalWriter(args.journal,
+                                args.journal_max_size * 1024 * 1024,
+                                args.journal_backups,
+                                args.journal_flush_interval)
+        journal.install([Unit, TableUnit], registry)
+        reactor.addSystemEventTrigger("before", "shutdown", journal.close)
+    return registry
+
+
+def log_queue_stats(registry):
+    """
+    :type registry: :class:`sagbescheid.notifier.NotifierRegistry`
+    """
+    for name, (depth, lag, dropped) in sorted(registry.queue_stats().items()):
+        logging.debug("Queue of the %s notifier: %d events, %.3fs lag, "
+                      "%d dropped", name, depth, lag, dropped)
+
+
+def enable_snapshots(tracker, filename, interval):
+    """Save the states of all units tracked by ``tracker`` to ``filename``
+    every ``interval`` seconds and on shutdown.
+
+    :type tracker: :class:`sagbescheid.tracker.UnitTracker`
+    :type filename: str
+    :type interval: float
+    """
+    def save():
+        try:
+            save_snapshot(filename, tracker.units.values())
+        except (IOError, OSError):
+            logging.exception("Saving the unit states to %s failed:",
+                              filename)
+
+    task.LoopingCall(save).start(interval, now=False)
+    reactor.addSystemEventTrigger("before", "shutdown", save)
+
+
+def get_unit_class(args):
+    """Return the class of the units to monitor.
+
+    :type args: :class:`argparse.Namespace`
+    :rtype: :class:`sagbescheid.unit.BaseUnit`
+    """
+    fast_transitions = args.fast_transitions
+    if fast_transitions is None:
+        # Monitoring all units can mean tens of thousands of them, so use the
+        # compact units in that case.
+        fast_transitions = args.all_units
+    return TableUnit if fast_transitions else Unit
+
+
 @defer.inlineCallbacks
-def setup(args):
+def setup(args, con=None, notifiers=None):
     """
     :type args: :class:`argparse.Namespace`
+    :param con: The connection to use instead of the system bus.
+    :type con: :class:`txdbus.client.DBusClientConnection`
+    :param notifiers: The notifiers to use instead of the ones enabled in
+                      ``args``.
+    :type notifiers: [:class:`sagbescheid.notifier.INotifier`]
+    :rtype: :class:`sagbescheid.tracker.UnitTracker`
     """
-    con = yield client.connect(reactor, "system")
-    registry = NotifierRegistry(get_enabled_notifiers(args.notifier))
+    if con is None:
+        con = yield client.connect(reactor, "system")
+    registry = build_registry(args, notifiers)
     try:
+        dispatcher = None
+        if args.shared_match_rule:
+            dispatcher = SignalDispatcher()
+            yield dispatcher.connect(con)
+        unit_class = get_unit_class(args)
+        unit_filter = compile_unit_filter(args.include, args.exclude,
+                                          args.unit_type)
+        tracker = UnitTracker(con, registry, dispatcher,
+                              args.connect_concurrency, unit_class,
+                              unit_filter)
+        last_states = None
+        if args.state_file:
+            last_states = load_snapshot(args.state_file)
+
         if args.all_units:
+            if args.track_units:
+                # Subscribe first, so no unit that gets loaded while the
+                # existing ones are being connected is missed.
+                yield tracker.subscribe()
             # Get the names of all units
-            units = yield get_all_unit_paths(con)
-            for unit in units:
-                yield Unit.from_child_object_path(unit, registry).connect(con)
+            states = dict((yield get_all_units(con,
+                                               unit_filter=unit_filter)))
+            units = [unit_class.from_child_object_path(unit, registry)
+                     for unit in states]
+            connected = yield tracker.add(units)
+            seed_units(connected, states, last_states)
             systemd_ready()
-            systemd_status("Monitoring {} units.".format(len(units)))
+            systemd_status("Monitoring {} units.".format(len(tracker.units)))
         else:
-            for unit in args.unit:
-                Unit.from_unit_filename(unit, registry).connect(con)
+            units = [unit_class.from_unit_filename(unit, registry)
+                     for unit in args.unit]
+            connected = yield tracker.add(units)
+            states = dict((yield get_all_units(con, args.unit)))
+            seed_units(connected, states, last_states)
             systemd_ready()
             systemd_status("Monitoring {}.".format(args.unit))
+        if args.state_file:
+            enable_snapshots(tracker, args.state_file,
+                             args.state_save_interval)
+        defer.returnValue(tracker)
     except error.DBusException:
         logging.exception(
             "The following exception occured during the initial setup:")
         reactor.stop()
 
 
+@defer.inlineCallbacks
+def reload_notifiers(old_args, new_args, registry):
+    """Enable the notifiers that are enabled in ``new_args`` but not in
+    ``old_args`` and disable those that aren't anymore. Notifiers whose
+    arguments changed are stopped and set up again, all others are left
+    alone.
+
+    :type old_args: :class:`argparse.Namespace`
+    :type new_args: :class:`argparse.Namespace`
+    :type registry: :class:`sagbescheid.notifier.NotifierRegistry`
+    """
+    notifiers = get_enabled_notifiers(new_args.notifier)
+    for notifier in notifiers:
+        if notifier.name not in old_args.notifier:
+            logging.info("Enabling the %s notifier", notifier.name)
+            notifier.handle_arguments(new_args)
+        elif changed_options(old_args, new_args,
+                             _notifier_dests.get(notifier.name, [])):
+            logging.info("Restarting the %s notifier", notifier.name)
+            yield defer.maybeDeferred(notifier.stop)
+            notifier.handle_arguments(new_args)
+
+    registry.configure(notifiers,
+                       new_args.notifier_queue_size,
+                       new_args.notifier_overflow,
+                       dict(new_args.flap_window),
+                       new_args.route)
+    if _status["instrumentation"] is not None:
+        _status["instrumentation"].install_notifiers(registry)
+
+    for notifier in get_enabled_notifiers(old_args.notifier):
+        if notifier.name not in new_args.notifier:
+            logging.info("Disabling the %s notifier", notifier.name)
+            yield defer.maybeDeferred(notifier.stop)
+
+
+@defer.inlineCallbacks
+def reload_units(args, tracker):
+    """Start monitoring the units selected by ``args`` that aren't monitored
+    yet and stop monitoring those that aren't selected anymore. The units
+    that stay keep their state.
+
+    :type args: :class:`argparse.Namespace`
+    :type tracker: :class:`sagbescheid.tracker.UnitTracker`
+    """
+    registry = tracker.notifier_registry
+    if args.all_units:
+        unit_filter = compile_unit_filter(args.include, args.exclude,
+                                          args.unit_type)
+        tracker.unit_filter = unit_filter
+        states = dict((yield get_all_units(tracker.con,
+                                           unit_filter=unit_filter)))
+        wanted = set(states)
+        added = [tracker.unit_class.from_child_object_path(unit, registry)
+                 for unit in wanted.difference(tracker.units)]
+    else:
+        units = dict((unit.object_path, unit) for unit in
+                     (tracker.unit_class.from_unit_filename(name, registry)
+                      for name in args.unit))
+        wanted = set(units)
+        added = [units[path] for path in wanted.difference(tracker.units)]
+        states = {}
+        if added:
+            states = dict((yield get_all_units(
+                tracker.con, [unit.name for unit in added])))
+
+    removed = set(tracker.units).difference(wanted)
+    for object_path in removed:
+        tracker.remove(object_path)
+    connected = yield tracker.add(added)
+    seed_units(connected, states)
+    logging.info("Added %d and removed %d units", len(connected),
+                 len(removed))
+    if args.all_units:
+        systemd_status("Monitoring {} units.".format(len(tracker.units)))
+    else:
+        systemd_status("Monitoring {}.".format(args.unit))
+
+
+@defer.inlineCallbacks
+def reload_config(parser, arguments, old_args, tracker):
+    """Parse the configuration file and ``arguments`` again and apply the
+    differences to ``old_args``.
+
+    :type parser: :class:`argparse.ArgumentParser`
+    :param arguments: The command line arguments.
+    :type arguments: [str]
+    :type old_args: :class:`argparse.Namespace`
+    :type tracker: :class:`sagbescheid.tracker.UnitTracker`
+    :return: The new arguments, or ``old_args`` if the configuration is
+             invalid.
+    :rtype: :class:`argparse.Namespace`
+    """
+    try:
+        new_args = parse_arguments(parser, arguments)
+    except SystemExit:
+        # The parser already printed the reason.
+        logging.error("The configuration is invalid, keeping the old one")
+        defer.returnValue(old_args)
+    if new_args.all_units != old_args.all_units:
+        logging.error("Switching between --unit and --all-units requires a "
+                      "restart, keeping the old configuration")
+        defer.returnValue(old_args)
+    for dest in changed_options(old_args, new_args, RESTART_OPTIONS):
+        logging.warning("Changing --%s requires a restart",
+                        dest.replace("_", "-"))
+        setattr(new_args, dest, getattr(old_args, dest))
+
+    logging.getLogger().setLevel(logging.DEBUG if new_args.verbose
+                                 else logging.INFO)
+    tracker.concurrency = new_args.connect_concurrency
+    yield reload_notifiers(old_args, new_args, tracker.notifier_registry)
+    tracker.report_states()
+    yield reload_units(new_args, tracker)
+    logging.info("Reloaded the configuration")
+    defer.returnValue(new_args)
+
+
+def enable_reload(parser, arguments, args, tracker):
+    """Reload the configuration on SIGHUP, see :func:`reload_config`.
+
+    :type parser: :class:`argparse.ArgumentParser`
+    :param arguments: The command line arguments.
+    :type arguments: [str]
+    :param args: The current configuration.
+    :type args: :class:`argparse.Namespace`
+    :type tracker: :class:`sagbescheid.tracker.UnitTracker`
+    """
+    current = {"args": args, "reloading": False}
+
+    @defer.inlineCallbacks
+    def reload():
+        if current["reloading"]:
+            logging.warning("Already reloading the configuration")
+            return
+        current["reloading"] = True
+        logging.info("Reloading the configuration")
+        try:
+            current["args"] = yield reload_config(parser, arguments,
+                                                  current["args"], tracker)
+        except Exception:
+            logging.exception("Reloading the configuration failed:")
+        finally:
+            current["reloading"] = False
+
+    signal.signal(signal.SIGHUP,
+                  lambda signum, frame: reactor.callFromThread(reload))
+
+
+@defer.inlineCallbacks
+def monitor(parser, arguments, args):
+    """Start monitoring the units and, if a configuration file is used,
+    reload it on SIGHUP.
+
+    :type parser: :class:`argparse.ArgumentParser`
+    :param arguments: The command line arguments.
+    :type arguments: [str]
+    :type args: :class:`argparse.Namespace`
+    """
+    tracker = yield setup(args)
+    if tracker is not None and args.config:
+        enable_reload(parser, arguments, args, tracker)
+
+
 def test(args):
-    registry = NotifierRegistry(get_enabled_notifiers(args.notifier))
+    registry = build_registry(args)
     units = []
     for unit in args.unit:
         units.append(Unit.from_unit_filename(unit, registry))
@@ -92,17 +417,122 @@ def test(args):
     reactor.callLater(2, emit_signals)
 
 
-def build_arg_parser():
-    parser = argparse.ArgumentParser(prog='sagbescheid',
-                                     fromfile_prefix_chars='@',
-                                     description='Monitor systemd unit states',
-                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)  # noqa
+@defer.inlineCallbacks
+def replay_journal(args):
+    """Feed the signals recorded in the journal ``args.replay`` to units
+    without connecting to D-Bus.
+
+    :type args: :class:`argparse.Namespace`
+    """
+    registry = build_registry(args)
+    unit_class = get_unit_class(args)
+    units = {}
+    if not args.all_units:
+        for name in args.unit:
+            unit = unit_class.from_unit_filename(name, registry)
+            units[unit.object_path] = unit
+
+    def on_signal(object_path, active_state):
+        unit = units.get(object_path)
+        if unit is None:
+            if not args.all_units:
+                return
+            unit = unit_class.from_child_object_path(object_path, registry)
+            units[object_path] = unit
+        unit.onSignal(UNIT_IFACE, {"ActiveState": active_state}, [])
+
+    start = reactor.seconds()
+    try:
+        replayed = yield replay(read_journal(args.replay), on_signal,
+                                args.replay_speed)
+        yield wait_for_queues(registry)
+        logging.info("Replayed %d signals for %d units in %.3fs", replayed,
+                     len(units), reactor.seconds() - start)
+    except Exception:
+        logging.exception("Replaying %s failed:", args.replay)
+    reactor.stop()
+
+
+def add_notifier_arguments(parser):
+    """Add the arguments for enabling and configuring notifiers to
+    ``parser``.
+
+    :type parser: :class:`argparse.ArgumentParser`
+    """
     available_notifiers = list(get_all_notifiers())
     available_notifier_names = map(attrgetter("name"),
                                    available_notifiers)
     parser.add_argument("--notifier", action="append", default=[],
                         choices=available_notifier_names,
                         help="A notifier to enable.")
+    parser.add_argument("--notifier-queue-size", action="store", type=int,
+                        default=0,
+                        help="Deliver events to every notifier through its "
+                        "own queue of this size. 0 delivers them directly.")
+    parser.add_argument("--notifier-overflow", action="store",
+                        default="drop-oldest", choices=OVERFLOW_POLICIES,
+                        help="What to do if the queue of a notifier is full.")
+    parser.add_argument("--flap-window", action="append", default=[],
+                        type=event_window, metavar="EVENT=SECONDS",
+                        help="Suppress all events of a unit for SECONDS "
+                        "after it emitted EVENT and summarize them "
+                        "afterwards.")
+    parser.add_argument("--route", action="append", default=[], type=route,
+                        metavar="NOTIFIER=EVENTS[@PATTERNS]",
+                        help="Only pass these comma separated events (or * "
+                        "for all of them) to NOTIFIER, and only for units "
+                        "whose name matches one of the comma separated "
+                        "globs or 're:' prefixed regular expressions, if "
+                        "given. Notifiers without a route get all events.")
+    for notifier in available_notifiers:
+        arg_group = RecordingGroup(parser.add_argument_group(
+            notifier.name, "Arguments for the %s notifier" % notifier.name))
+        notifier.add_arguments(arg_group)
+        _notifier_dests[notifier.name] = arg_group.dests
+
+
+def build_arg_parser():
+    parser = ConfigArgumentParser(prog='sagbescheid',
+                                  fromfile_prefix_chars='@',
+                                  description='Monitor systemd unit states',
+                                  formatter_class=argparse.ArgumentDefaultsHelpFormatter)  # noqa
+    add_notifier_arguments(parser)
+    parser.add_argument("--config", action="store", metavar="FILE",
+                        help="Read options from this INI file. Options given "
+                        "on the command line replace the same options in the "
+                        "file. It is reread on SIGHUP.")
+    parser.add_argument("--instrument", action="store_true", default=False,
+                        help="Measure the time spent processing signals and "
+                        "events. A summary is added to the status shown by "
+                        "systemd, the details are logged on SIGUSR1.")
+    parser.add_argument("--instrument-interval", action="store", type=float,
+                        default=10,
+                        help="How often the status shown by systemd is "
+                        "updated with --instrument, in seconds.")
+    parser.add_argument("--journal", action="store", metavar="FILE",
+                        help="Record all received signals and emitted events "
+                        "in this journal. It can be replayed with --replay.")
+    parser.add_argument("--journal-max-size", action="store", type=int,
+                        default=100,
+                        help="Rotate the journal once it reaches this size, "
+                        "in MiB.")
+    parser.add_argument("--journal-backups", action="store", type=int,
+                        default=5,
+                        help="The number of rotated journals to keep.")
+    parser.add_argument("--journal-flush-interval", action="store",
+                        type=float, default=1,
+                        help="How often recorded signals and events are "
+                        "written to the journal, in seconds.")
+    parser.add_argument("--state-file", action="store", metavar="FILE",
+                        help="Save the states of all units to this file and "
+                        "restore them from it on startup, so state changes "
+                        "while sagbescheid wasn't running are reported "
+                        "properly.")
+    parser.add_argument("--state-save-interval", action="store", type=float,
+                        default=60,
+                        help="How often the states of all units are saved "
+                        "to --state-file, in seconds. They are always saved "
+                        "on shutdown.")
     parser.add_argument("-v", "--verbose", action="store_true", default=False,
                         help="Be more verbose.")
     group = parser.add_mutually_exclusive_group(required=True)
@@ -110,12 +540,45 @@ def build_arg_parser():
                        help="A unit to monitor.")
     group.add_argument("--all-units", action="store_true", default=False,
                        help="Monitor all units.")
-
-    for notifier in available_notifiers:
-        arg_group = parser.add_argument_group(notifier.name,
-                                              "Arguments for the %s notifier" %
-                                              notifier.name)
-        notifier.add_arguments(arg_group)
+    parser.add_argument("--include", action="append", default=[],
+                        type=unit_pattern, metavar="PATTERN",
+                        help="Only monitor units whose name matches one of "
+                        "these globs, or regular expressions if prefixed "
+                        "with 're:'. Only has an effect with --all-units.")
+    parser.add_argument("--exclude", action="append", default=[],
+                        type=unit_pattern, metavar="PATTERN",
+                        help="Don't monitor units whose name matches one of "
+                        "these globs, or regular expressions if prefixed "
+                        "with 're:'. Only has an effect with --all-units.")
+    parser.add_argument("--unit-type", action="append", default=[],
+                        metavar="TYPE",
+                        help="Only monitor units of these types, for example "
+                        "service or timer. Only has an effect with "
+                        "--all-units.")
+    parser.add_argument("--connect-concurrency", action="store",
+                        type=positive_int, default=16,
+                        help="The maximum number of units to connect to at "
+                        "the same time.")
+    parser.add_argument("--shared-match-rule", action="store_true",
+                        default=False,
+                        help="Receive the signals of all units through a "
+                        "single D-Bus match rule instead of one per unit.")
+    parser.add_argument("--track-units", action="store_true", default=False,
+                        help="Start and stop monitoring units as systemd "
+                        "loads and unloads them. Only has an effect with "
+                        "--all-units.")
+    transitions_group = parser.add_mutually_exclusive_group()
+    transitions_group.add_argument("--fast-transitions", action="store_true",
+                                   default=None,
+                                   help="Track unit states through a "
+                                   "precompiled transition table instead of "
+                                   "automat. This is the default with "
+                                   "--all-units.")
+    transitions_group.add_argument("--no-fast-transitions",
+                                   action="store_false",
+                                   dest="fast_transitions",
+                                   help="Track unit states through automat, "
+                                   "even with --all-units.")
     test_group = parser.add_argument_group("Test notifications", """Send a test
     notification for enabled units""")
     test_group.add_argument("--test",
@@ -131,6 +594,17 @@ def build_arg_parser():
             #                choices=State.__members__.keys(),
                             default="active",
                             help="The state units will transition to")
+    replay_group = parser.add_argument_group("Replay", """Feed the signals
+    recorded in a journal to the enabled units instead of connecting to
+    D-Bus""")
+    replay_group.add_argument("--replay", action="store", metavar="FILE",
+                              help="The journal to replay")
+    replay_group.add_argument("--replay-speed", action="store", type=float,
+                              default=0,
+                              help="Replay the journal at this multiple of "
+                              "the speed it has been recorded at, 1 replays "
+                              "it in real time. 0 replays it as fast as "
+                              "possible.")
     return parser
 
 
@@ -139,7 +613,8 @@ def main():
     observer.start()
 
     parser = build_arg_parser()
-    args = parser.parse_args()
+    arguments = argv[1:]
+    args = parse_arguments(parser, arguments)
     if args.verbose:
         logging.basicConfig(level=logging.DEBUG)
     else:
@@ -147,8 +622,10 @@ def main():
     for notifier in get_enabled_notifiers(args.notifier):
         notifier.handle_arguments(args)
 
-    if not args.test:
-        reactor.callWhenRunning(partial(setup, args))
+    if args.replay:
+        reactor.callWhenRunning(partial(replay_journal, args))
+    elif not args.test:
+        reactor.callWhenRunning(partial(monitor, parser, arguments, args))
     else:
         test(args)
     systemd_status("Discovering units")
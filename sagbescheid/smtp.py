@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import logging
+
+
+from collections import deque
+from twisted.internet import defer, protocol, reactor
+from twisted.mail.smtp import (DNSNAME, ESMTPSender, SMTPClient,
+                               SMTPConnectError, SMTPDeliveryError, SUCCESS)
+
+
+class PersistentESMTPSender(ESMTPSender):
+    """An :class:`twisted.mail.smtp.ESMTPSender` that sends all messages
+    queued in its factory over a single connection.
+
+    Once the queue is empty, the connection is kept open for
+    ``factory.idle_timeout`` seconds. Messages queued in the meantime are
+    sent right away, without another TCP handshake, STARTTLS and
+    authentication.
+    """
+
+    def __init__(self, *args, **kwargs):
+        ESMTPSender.__init__(self, *args, **kwargs)
+        self._current = None
+        self._idle = None
+
+    def getMailFrom(self):
+        if not self.factory.queue:
+            return None
+        self._current = self.factory.queue.popleft()
+        return self.factory.from_
+
+    def getMailTo(self):
+        return [self.factory.to]
+
+    def getMailData(self):
+        return self._current[0]
+
+    def sentMail(self, code, resp, numOk, addresses, log):
+        _, result = self._current
+        self._current = None
+        if code in SUCCESS:
+            result.callback((numOk, addresses))
+        else:
+            result.errback(SMTPDeliveryError(code, resp, log.str(), addresses))
+
+    def sendError(self, exc):
+        SMTPClient.sendError(self, exc)
+        self._fail_current(exc)
+        self.factory.fail_all(exc)
+
+    def _fail_current(self, exc):
+        if self._current is None:
+            return
+        _, result = self._current
+        self._current = None
+        result.errback(exc)
+
+    def smtpState_from(self, code, resp):
+        if self.factory.queue:
+            ESMTPSender.smtpState_from(self, code, resp)
+            return
+
+        # Nothing to send right now. Instead of saying QUIT, wait a bit for
+        # more messages.
+        self._idle = (code, resp, reactor.callLater(self.factory.idle_timeout,
+                                                    self._idle_timeout))
+
+    def wake(self):
+        """Start sending queued messages if the connection is idle.
+        """
+        if self._idle is None:
+            return
+        code, resp, call = self._idle
+        self._idle = None
+        call.cancel()
+        ESMTPSender.smtpState_from(self, code, resp)
+
+    def _idle_timeout(self):
+        code, resp, _ = self._idle
+        self._idle = None
+        ESMTPSender.smtpState_from(self, code, resp)
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        ESMTPSender.connectionLost(self, reason)
+        if self._idle is not None:
+            self._idle[2].cancel()
+            self._idle = None
+        self._fail_current(reason.value)
+
+
+class PersistentSMTPFactory(protocol.ClientFactory):
+    """Sends messages through a :class:`PersistentESMTPSender`, connecting to
+    the server whenever there are messages to send and no connection.
+    """
+
+    protocol = PersistentESMTPSender
+
+    def __init__(self, host, port, from_, to, username=None, password=None,
+                 require_authentication=False,
+                 require_transport_security=False, idle_timeout=10):
+        """
+        :type host: str
+        :type port: int
+        :param from_: The envelope sender address.
+        :type from_: str
+        :param to: The envelope recipient address.
+        :type to: str
+        :type username: str
+        :type password: str
+        :type require_authentication: bool
+        :type require_transport_security: bool
+        :param idle_timeout: The number of seconds an idle connection is kept
+                             open.
+        :type idle_timeout: float
+        """
+        self.host = host
+        self.port = port
+        self.from_ = from_
+        self.to = to
+        self.username = username
+        self.password = password
+        self.require_authentication = require_authentication
+        self.require_transport_security = require_transport_security
+        self.idle_timeout = idle_timeout
+        self.queue = deque()
+        self.current_protocol = None
+        self._connecting = False
+
+    def send(self, message):
+        """Send ``message``.
+
+        :param message: The message, including headers.
+        :type message: file
+        :return: A :class:`twisted.internet.defer.Deferred` firing once the
+                 server accepted the message.
+        """
+        result = defer.Deferred()
+        self.queue.append((message, result))
+        if self.current_protocol is not None:
+            self.current_protocol.wake()
+        elif not self._connecting:
+            self._connecting = True
+            reactor.connectTCP(self.host, self.port, self)
+        return result
+
+    def fail_all(self, exc):
+        """Fail all queued messages with ``exc``.
+        """
+        while self.queue:
+            _, result = self.queue.popleft()
+            result.errback(exc)
+
+    def buildProtocol(self, addr):
+        p = self.protocol(self.username, self.password, None, DNSNAME,
+                          hostname=self.host)
+        p.heloFallback = True
+        p.requireAuthentication = self.require_authentication
+        p.requireTransportSecurity = self.require_transport_security
+        p.factory = self
+        self.current_protocol = p
+        self._connecting = False
+        return p
+
+    def clientConnectionFailed(self, connector, reason):
+        self._connecting = False
+        logging.error("Connecting to %s:%s failed: %s", self.host, self.port,
+                      reason.getErrorMessage())
+        self.fail_all(SMTPConnectError(-1, reason.getErrorMessage()))
+
+    def clientConnectionLost(self, connector, reason):
+        self.current_protocol = None
+        if self.queue:
+            # Messages have been queued while the connection was shutting
+            # down.
+            self._connecting = True
+            connector.connect()
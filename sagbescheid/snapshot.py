@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Snapshots of the states of all units, so they survive restarts.
+
+A snapshot is a text file with a header line followed by one line per unit,
+made up of its object path and the name of its state, separated by a tab.
+"""
+import logging
+import os
+
+
+from .unit import STATE_NAMES
+
+
+# The first line of every snapshot, for telling snapshots of different
+# formats apart.
+SNAPSHOT_HEADER = "# sagbescheid state snapshot 1\n"
+
+
+def save_snapshot(filename, units):
+    """Write the states of ``units`` to ``filename``.
+
+    The snapshot is written to a temporary file that replaces ``filename``
+    afterwards, so there is always a complete snapshot, even if sagbescheid
+    is killed while writing it.
+
+    :type filename: str
+    :type units: [:class:`sagbescheid.unit.BaseUnit`]
+    """
+    lines = ["%s\t%s\n" % (unit.object_path, unit.state) for unit in units
+             if unit.state != "unknown"]
+    temporary = filename + ".tmp"
+    with open(temporary, "w") as snapshot:
+        snapshot.write(SNAPSHOT_HEADER)
+        snapshot.write("".join(lines))
+    os.rename(temporary, filename)
+    logging.debug("Saved the states of %d units to %s", len(lines), filename)
+
+
+def load_snapshot(filename):
+    """Return the states saved in ``filename``, or an empty mapping if there
+    is no usable snapshot.
+
+    :type filename: str
+    :return: A mapping of object paths to state names.
+    :rtype: {str: str}
+    """
+    try:
+        with open(filename) as snapshot:
+            data = snapshot.read()
+    except IOError as e:
+        logging.info("Not restoring unit states from %s: %s", filename, e)
+        return {}
+
+    if not data.startswith(SNAPSHOT_HEADER):
+        logging.warning("Not restoring unit states, %s is not a snapshot",
+                        filename)
+        return {}
+
+    valid_states = set(STATE_NAMES)
+    states = {}
+    for line in data[len(SNAPSHOT_HEADER):].splitlines():
+        object_path, _, state = line.partition("\t")
+        if state in valid_states:
+            states[object_path] = state
+        else:
+            logging.warning("%s: Skipping malformed line %r", filename, line)
+    logging.info("Loaded the states of %d units from %s", len(states),
+                 filename)
+    return states
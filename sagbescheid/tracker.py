@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import logging
+
+
+from .unit import (connect_units, MANAGER_IFACE, MANAGER_PATH,
+                   SYSTEMD_BUS_NAME, Unit)
+from twisted.internet import defer
+
+
+class UnitTracker(object):
+    """Keeps track of all monitored units.
+
+    Units can be added and removed at any time. If :meth:`subscribe` has been
+    called, units that systemd loads or unloads later on are added and
+    removed automatically, so the number of tracked units always follows the
+    number of units systemd knows about.
+    """
+
+    def __init__(self, con, notifier_registry, dispatcher=None,
+                 concurrency=16, unit_class=Unit, unit_filter=None):
+        """
+        :type con: :class:`txdbus.client.DBusClientConnection`
+        :type notifier_registry: :class:`sagbescheid.notifier.NotifierRegistry`
+        :param dispatcher: If set, units will receive their signals through
+                           it instead of connecting them individually.
+        :type dispatcher: :class:`sagbescheid.dispatcher.SignalDispatcher`
+        :type concurrency: int
+        :param unit_class: The class of units added through ``UnitNew``.
+        :type unit_class: :class:`sagbescheid.unit.BaseUnit`
+        :param unit_filter: If set, units announced through ``UnitNew`` are
+                            only added if it returns ``True`` for their name.
+        """
+        self.con = con
+        self.notifier_registry = notifier_registry
+        self.dispatcher = dispatcher
+        self.concurrency = concurrency
+        self.unit_class = unit_class
+        self.unit_filter = unit_filter
+        self.units = {}
+
+    @defer.inlineCallbacks
+    def add(self, units):
+        """Start tracking ``units``. Units whose object path is already being
+        tracked are ignored.
+
+        :type units: [:class:`sagbescheid.unit.Unit`]
+        :return: The units that are being tracked now.
+        :rtype: [:class:`sagbescheid.unit.Unit`]
+        """
+        new_units = []
+        for unit in units:
+            if unit.object_path not in self.units:
+                # Reserve the path right away so that a UnitNew signal
+                # arriving while the unit is being connected doesn't connect
+                # it a second time.
+                self.units[unit.object_path] = unit
+                new_units.append(unit)
+
+        if self.dispatcher is not None:
+            for unit in new_units:
+                self.dispatcher.add(unit)
+            defer.returnValue(new_units)
+
+        connected = yield connect_units(self.con, new_units, self.concurrency)
+        tracked = []
+        for unit in connected:
+            if self.units.get(unit.object_path) is unit:
+                tracked.append(unit)
+            else:
+                # The unit has been removed while it was being connected.
+                unit.disconnect()
+        for unit in set(new_units) - set(connected):
+            if self.units.get(unit.object_path) is unit:
+                del self.units[unit.object_path]
+        defer.returnValue(tracked)
+
+    def remove(self, object_path):
+        """Stop tracking the unit at ``object_path``.
+
+        :type object_path: str
+        """
+        unit = self.units.pop(object_path, None)
+        if unit is None:
+            return
+        if self.dispatcher is not None:
+            self.dispatcher.remove(object_path)
+        else:
+            unit.disconnect()
+        self.notifier_registry.unit_removed(object_path)
+
+    def report_states(self):
+        """Pass the state of every tracked unit that left the unknown state
+        to :meth:`NotifierRegistry.unit_state_changed
+        <sagbescheid.notifier.NotifierRegistry.unit_state_changed>`, for
+        notifiers that have been enabled after the units.
+        """
+        registry = self.notifier_registry
+        for object_path, unit in self.units.items():
+            state = unit.state
+            if state != "unknown":
+                registry.unit_state_changed(object_path, state)
+
+    @defer.inlineCallbacks
+    def subscribe(self):
+        """Subscribe to systemds ``UnitNew`` and ``UnitRemoved`` signals to
+        add and remove units as systemd loads and unloads them.
+        """
+        manager = yield self.con.getRemoteObject(SYSTEMD_BUS_NAME,
+                                                 MANAGER_PATH)
+        yield manager.notifyOnSignal("UnitNew", self._on_unit_new,
+                                     interface=MANAGER_IFACE)
+        yield manager.notifyOnSignal("UnitRemoved", self._on_unit_removed,
+                                     interface=MANAGER_IFACE)
+        yield manager.callRemote("Subscribe", interface=MANAGER_IFACE)
+
+    def _on_unit_new(self, unit_name, object_path):
+        """
+        :type unit_name: str
+        :type object_path: str
+        """
+        if object_path in self.units:
+            return
+        if self.unit_filter is not None and not self.unit_filter(unit_name):
+            return
+        logging.info("Discovered a new unit at %s", object_path)
+        self.add([self.unit_class.from_child_object_path(
+            object_path, self.notifier_registry)])
+
+    def _on_unit_removed(self, unit_name, object_path):
+        """
+        :type unit_name: str
+        :type object_path: str
+        """
+        if object_path not in self.units:
+            return
+        logging.info("The unit at %s has been removed", object_path)
+        self.remove(object_path)
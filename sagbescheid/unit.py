@@ -3,31 +3,152 @@
 # Copyright © 2015, 2017, 2018 Wieland Hoffmann
 # License: MIT, see LICENSE for details
 import logging
+import six
+import string
 
 
 from automat import MethodicalMachine, NoTransition
 from functools import wraps
-from twisted.internet import defer
+from twisted.internet import defer, reactor
+from txdbus.interface import DBusInterface, Method, Signal
 
 
+PROPERTIES_IFACE = "org.freedesktop.DBus.Properties"
 SERVICE_IFACE = "org.freedesktop.systemd1.Service"
 UNIT_IFACE = "org.freedesktop.systemd1.Unit"
 
 
-PATH_REPLACEMENTS = {
-    ".": "_2e",
-    "-": "_2d",
-    "/": "_2f"
-}
+# The escaped form of every byte in a bus path label. Letters and digits are
+# kept, everything else becomes _ followed by two lowercase hex digits.
+PATH_ESCAPES = ["_%02x" % byte for byte in range(256)]
+for char in string.ascii_letters + string.digits:
+    PATH_ESCAPES[ord(char)] = char
+del char
 
+# The byte, as a character, for every pair of hex digits following a _ in an
+# escaped bus path label.
+PATH_UNESCAPES = {}
+for byte in range(256):
+    PATH_UNESCAPES["%02x" % byte] = PATH_UNESCAPES["%02X" % byte] = chr(byte)
+del byte
+
+MANAGER_IFACE = "org.freedesktop.systemd1.Manager"
+MANAGER_PATH = "/org/freedesktop/systemd1"
 SYSTEMD_BUS_NAME = "org.freedesktop.systemd1"
 UNIT_PATH_PREFIX = "/org/freedesktop/systemd1/unit/"
 
+# The parts of the interfaces of unit objects we're using. Passing them to
+# getRemoteObject avoids introspecting (and parsing the introspection data of)
+# every single unit, which is the same for all of them anyway.
+UNIT_INTERFACES = [
+    DBusInterface(PROPERTIES_IFACE,
+                  Method("Get", arguments="ss", returns="v"),
+                  Signal("PropertiesChanged", "sa{sv}as"),
+                  noRegister=True),
+    DBusInterface(UNIT_IFACE, noRegister=True),
+]
+
+
+def escape_path_label(label):
+    """Escape ``label`` for use as an element of a bus path, like systemds
+    ``bus_label_escape`` does: letters and digits (except a leading one) are
+    kept, all other bytes of the UTF-8 encoded label are replaced by ``_`` and
+    two hex digits. The empty string becomes ``_``.
+
+    :type label: str
+    :rtype: str
+    """
+    if not label:
+        return "_"
+    data = bytearray(six.ensure_binary(label))
+    escaped = "".join([PATH_ESCAPES[byte] for byte in data])
+    if escaped[0] in string.digits:
+        escaped = "_%02x%s" % (data[0], escaped[1:])
+    return escaped
+
+
+def unescape_path_label(label):
+    """Reverse :func:`escape_path_label`.
+
+    :type label: str
+    :rtype: str
+    :raises ValueError: If ``label`` contains an invalid escape sequence.
+    """
+    if label == "_":
+        return ""
+    parts = label.split("_")
+    if len(parts) == 1:
+        return label
+    pieces = [parts[0]]
+    for part in parts[1:]:
+        char = PATH_UNESCAPES.get(part[:2])
+        if char is None:
+            raise ValueError("Invalid escape sequence in %s" % label)
+        pieces.append(char)
+        pieces.append(part[2:])
+    name = "".join(pieces)
+    if not six.PY2:
+        try:
+            name.encode("ascii")
+        except UnicodeEncodeError:
+            # The characters are the bytes of the UTF-8 encoded name.
+            name = name.encode("latin-1").decode("utf-8")
+    return name
+
 
 def make_path(unit):
-    for from_, to in PATH_REPLACEMENTS.iteritems():
-        unit = unit.replace(from_, to)
-    return unit
+    """Return the escaped name of ``unit`` as used in its object path.
+
+    :type unit: str
+    :rtype: str
+    """
+    return escape_path_label(unit)
+
+
+# The maximum number of names cached by unit_name. Once it's reached, the
+# cache starts over, so paths of units that are long gone don't pile up.
+UNIT_NAME_CACHE_SIZE = 10000
+
+# The names returned by unit_name, by object path.
+_unit_names = {}
+
+
+def unit_name(object_path):
+    """Return the name of the unit at ``object_path``. The names of the
+    last :data:`UNIT_NAME_CACHE_SIZE` object paths are cached.
+
+    Object paths prefixed with the name of a host by the collector, like
+    ``host:/org/freedesktop/systemd1/unit/nginx_2eservice``, give names
+    prefixed with it as well, like ``host:nginx.service``.
+
+    :type object_path: str
+    :rtype: str
+    """
+    name = _unit_names.get(object_path)
+    if name is not None:
+        return name
+    if len(_unit_names) >= UNIT_NAME_CACHE_SIZE:
+        _unit_names.clear()
+    name = _unit_names[object_path] = object_path_to_name(object_path)
+    return name
+
+
+def object_path_to_name(object_path):
+    """Return the name of the unit at ``object_path`` without caching it,
+    see :func:`unit_name`.
+
+    :type object_path: str
+    :rtype: str
+    """
+    host, _, path = object_path.rpartition(":")
+    label = path.rsplit("/", 1)[-1]
+    try:
+        name = unescape_path_label(label)
+    except ValueError:
+        name = label
+    if host:
+        name = "%s:%s" % (host, name)
+    return name
 
 
 def passthrough_to_registry(func):
@@ -44,8 +165,13 @@ def passthrough_to_registry(func):
     return wrapper
 
 
-class Unit(object):
-    _machine = MethodicalMachine()
+class BaseUnit(object):
+    """The parts of a unit that don't depend on how its state is tracked.
+
+    Subclasses implement :meth:`_become` and :attr:`state`.
+    """
+
+    __slots__ = ("object_path", "notifier_registry", "_subscription", "_name")
 
     def __init__(self, name, notifier_registry):
         """
@@ -54,6 +180,8 @@ class Unit(object):
         """
         self.object_path = name
         self.notifier_registry = notifier_registry
+        self._subscription = None
+        self._name = None
 
     @classmethod
     def from_unit_filename(cls, name, notifier_registry):
@@ -64,7 +192,7 @@ class Unit(object):
         :type name: str
         :type notifier_registry: :class:`sagbescheid.notifier.NotifierRegistry`
         """
-        name = UNIT_PATH_PREFIX + make_path(name)
+        name = UNIT_PATH_PREFIX + escape_path_label(name)
         return cls(name, notifier_registry)
 
     @classmethod
@@ -78,6 +206,17 @@ class Unit(object):
         """
         return cls(name, notifier_registry)
 
+    @property
+    def name(self):
+        """The name of the unit, like ``nginx.service``. It's only computed
+        once.
+
+        :rtype: str
+        """
+        if self._name is None:
+            self._name = object_path_to_name(self.object_path)
+        return self._name
+
     @defer.inlineCallbacks
     def connect(self, con):
         """Connect to the units ``PropertiesChanged`` signal on ``con``.
@@ -85,10 +224,20 @@ class Unit(object):
         :type con: :class:`txdbus.client.DBusClientConnection`
         """
         logging.debug("Connecting %s", self.object_path)
-        robj = yield con.getRemoteObject(SYSTEMD_BUS_NAME, self.object_path)
-        state = yield robj.callRemote("Get", UNIT_IFACE, "ActiveState")
-        logging.debug("The state of %s is %s", self.object_path, state)
-        robj.notifyOnSignal("PropertiesChanged", self.onSignal)
+        robj = yield con.getRemoteObject(SYSTEMD_BUS_NAME, self.object_path,
+                                         interfaces=UNIT_INTERFACES)
+        rule_id = yield robj.notifyOnSignal("PropertiesChanged", self.onSignal)
+        self._subscription = (robj, rule_id)
+
+    def disconnect(self):
+        """Stop receiving the units ``PropertiesChanged`` signal.
+        """
+        if self._subscription is None:
+            return
+        logging.debug("Disconnecting %s", self.object_path)
+        robj, rule_id = self._subscription
+        robj.cancelSignalNotification(rule_id)
+        self._subscription = None
 
     def onSignal(self, iface, changed, invalidated):
         if iface == UNIT_IFACE:
@@ -97,52 +246,156 @@ class Unit(object):
             if new_raw_state is None:
                 return
 
-            meth = getattr(self, "become_{}".format(new_raw_state))
             try:
-                meth()
-            except NoTransition as e:
-                logging.exception("%s: %s", self.object_path, e)
-                raise
+                self._become(new_raw_state)
+            except NoTransition:
+                # Already logged, the unit stays in its state until the next
+                # signal.
+                pass
+
+    def seed(self, raw_state, last_state=None):
+        """Move the unit from the unknown state into ``raw_state``, which is
+        usually its ``ActiveState`` as returned by ``ListUnits``.
+
+        If ``last_state`` is set, the unit is restored to it first, so the
+        change from ``last_state`` to ``raw_state`` (a failure while
+        sagbescheid wasn't running, for example) emits the usual events
+        instead of ``change_from_unknown``.
+
+        If ``last_state`` is ``raw_state``, nothing happened while sagbescheid
+        wasn't running, so the unit is just restored to it without emitting
+        any events. Otherwise, ``failed`` units that are still failed would
+        report an ``ongoing_failure`` on every restart.
+
+        Units that already left the unknown state (because a signal arrived
+        in the meantime) are not touched, the signal is more recent.
+
+        :type raw_state: str
+        :param last_state: The name of a state, as returned by :attr:`state`.
+        :type last_state: str
+        """
+        if self.state != "unknown":
+            return
+        if last_state is not None:
+            self.restore(last_state)
+            self.notifier_registry.unit_state_changed(self.object_path,
+                                                      last_state)
+            if last_state == raw_state:
+                return
+        try:
+            self._become(raw_state)
+        except NoTransition:
+            # Already logged, the unit stays in its last state.
+            pass
+
+    def restore(self, state):
+        """Put the unit into ``state`` without emitting any events.
+
+        :param state: The name of a state, as returned by :attr:`state`.
+        :type state: str
+        """
+        raise NotImplementedError
+
+    def _become(self, new_raw_state):
+        """Move the unit into ``new_raw_state``, passing the events of the
+        transition to :meth:`NotifierRegistry.handle_event
+        <sagbescheid.notifier.NotifierRegistry.handle_event>` and the new
+        state, if it differs from the old one, to
+        :meth:`NotifierRegistry.unit_state_changed
+        <sagbescheid.notifier.NotifierRegistry.unit_state_changed>`.
+
+        :type new_raw_state: str
+        :raises NoTransition: If there's no transition into
+                              ``new_raw_state``.
+        """
+        raise NotImplementedError
+
+    @property
+    def state(self):
+        """The name of the current state.
+
+        :rtype: str
+        """
+        raise NotImplementedError
+
+
+class Unit(BaseUnit):
+    _machine = MethodicalMachine()
+
+    def _become(self, new_raw_state):
+        """
+        :type new_raw_state: str
+        """
+        input_name = "become_{}".format(new_raw_state)
+        meth = getattr(self, input_name, None)
+        old_state = self.state
+        try:
+            if meth is None:
+                # A state the machine doesn't model, like maintenance.
+                raise NoTransition(old_state, input_name)
+            meth()
+        except NoTransition as e:
+            logging.exception("%s: %s", self.object_path, e)
+            raise
+        new_state = self.state
+        if new_state != old_state:
+            self.notifier_registry.unit_state_changed(self.object_path,
+                                                      new_state)
+
+    @property
+    def state(self):
+        return self._serialize()
+
+    @_machine.serializer()
+    def _serialize(self, state):
+        return state
+
+    def restore(self, state):
+        self._unserialize(state)
+
+    @_machine.unserializer()
+    def _unserialize(self, state):
+        return state
 
     setTheTracingFunction = _machine._setTrace
 
-    @_machine.state(initial=True)
+    @_machine.state(initial=True, serialized="unknown")
     def unknown(self):
         """The unknown state.
         """
         pass
 
-    @_machine.state()
+    @_machine.state(serialized="active")
     def active(self):
         """The active state.
         """
         pass
 
-    @_machine.state()
+    @_machine.state(serialized="inactive")
     def inactive(self):
         """The inactive state.
         """
         pass
 
-    @_machine.state()
+    @_machine.state(serialized="failed")
     def failed(self):
         """The failed state.
         """
         pass
 
-    @_machine.state()
+    @_machine.state(serialized="reloading")
     def reloading(self):
         """The reloading state.
         """
         pass
 
-    @_machine.state()
+    @_machine.state(serialized="activating")
     def activating(self):
         """The activating state.
         """
         pass
 
-    @_machine.state()
+    @_machine.state(serialized="deactivating")
     def deactivating(self):
         """The deactivating state.
         """
@@ -326,15 +579,187 @@ class Unit(object):
                       outputs=[])
 
 
+def compile_transition_table(machine):
+    """Compile the transitions of the state machine ``machine`` into a table.
+
+    The table is a list with one entry per state, in the order of
+    :data:`STATE_NAMES`. Each entry maps the raw name of the new state to a
+    tuple of the index of the new state and the names of the outputs.
+
+    :type machine: :class:`automat.MethodicalMachine`
+    :rtype: ([str], [{str: (int, (str,))}])
+    """
+    automaton = machine._automaton
+    initial = automaton.initialState.serialized
+    state_names = [initial] + sorted(state.serialized
+                                     for state in automaton.states()
+                                     if state.serialized != initial)
+    state_codes = {name: code for code, name in enumerate(state_names)}
+    table = [{} for _ in state_names]
+    for in_state, input_, out_state, outputs in automaton.allTransitions():
+        raw_state = input_.method.__name__[len("become_"):]
+        table[state_codes[in_state.serialized]][raw_state] = (
+            state_codes[out_state.serialized],
+            tuple(output.method.__name__ for output in outputs))
+    return state_names, table
+
+
+# The transitions of Unit, for units that don't need the automat machinery.
+STATE_NAMES, TRANSITION_TABLE = compile_transition_table(Unit._machine)
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+
+
+class TableUnit(BaseUnit):
+    """A unit whose state is tracked through :data:`TRANSITION_TABLE`.
+
+    It emits exactly the same events as :class:`Unit`, but a transition
+    only costs a list index and a dict lookup instead of going through
+    automat.
+
+    Instances have no ``__dict__`` and store their state as an index into
+    :data:`STATE_NAMES`. Excluding the object path (which is shared with the
+    dicts holding the units), an instance takes 72 bytes on a 64 bit CPython,
+    compared to roughly 200 bytes for a :class:`Unit` with its ``__dict__``
+    and automat state.
+    """
+
+    __slots__ = ("_state",)
+
+    def __init__(self, name, notifier_registry):
+        super(TableUnit, self).__init__(name, notifier_registry)
+        self._state = 0
+
+    def _become(self, new_raw_state):
+        """
+        :type new_raw_state: str
+        """
+        transition = TRANSITION_TABLE[self._state].get(new_raw_state)
+        if transition is None:
+            e = NoTransition(STATE_NAMES[self._state],
+                             "become_{}".format(new_raw_state))
+            logging.error("%s: %s", self.object_path, e)
+            raise e
+        old_state = self._state
+        self._state, outputs = transition
+        registry = self.notifier_registry
+        for event_name in outputs:
+            registry.handle_event(self.object_path, event_name)
+        if self._state != old_state:
+            registry.unit_state_changed(self.object_path,
+                                        STATE_NAMES[self._state])
+
+    @property
+    def state(self):
+        return STATE_NAMES[self._state]
+
+    def restore(self, state):
+        self._state = STATE_CODES[state]
+
+
 @defer.inlineCallbacks
-def get_all_unit_paths(con):
-    robj = yield con.getRemoteObject(SYSTEMD_BUS_NAME, "/org/freedesktop/systemd1")  # noqa
-    dbus_units = yield robj.callRemote("ListUnits",
-                                       interface="org.freedesktop.systemd1.Manager")  # noqa
+def get_all_units(con, names=None, unit_filter=None):
+    """Return the object paths and active states of all units, or only those
+    of the units called ``names``.
+
+    :type con: :class:`txdbus.client.DBusClientConnection`
+    :type names: [str]
+    :param unit_filter: If set, only units whose name it returns ``True`` for
+                        are returned, see
+                        :func:`sagbescheid.filters.compile_unit_filter`.
+    :rtype: [(str, str)]
+    """
+    robj = yield con.getRemoteObject(SYSTEMD_BUS_NAME, MANAGER_PATH)
+    if names is None:
+        dbus_units = yield robj.callRemote("ListUnits",
+                                           interface=MANAGER_IFACE)
+    else:
+        dbus_units = yield robj.callRemote("ListUnitsByNames", names,
+                                           interface=MANAGER_IFACE)
     units = []
     for elem in dbus_units:
+        if unit_filter is not None and not unit_filter(elem[0]):
+            continue
         unit_name = elem[6]
         logging.info("Discovered a new unit at %s", unit_name)
-        units.append(unit_name)
+        units.append((unit_name, elem[3]))
 
     defer.returnValue(units)
+
+
+@defer.inlineCallbacks
+def get_all_unit_paths(con, unit_filter=None):
+    units = yield get_all_units(con, unit_filter=unit_filter)
+    defer.returnValue([object_path for object_path, _ in units])
+
+
+def seed_units(units, states, last_states=None):
+    """Seed all ``units`` with their state from ``states`` in one go.
+
+    :type units: [:class:`sagbescheid.unit.Unit`]
+    :param states: A mapping of object paths to active states, as returned by
+                   :func:`get_all_units`.
+    :type states: {str: str}
+    :param last_states: A mapping of object paths to the states units have
+                        been in before sagbescheid was restarted, see
+                        :meth:`BaseUnit.seed`.
+    :type last_states: {str: str}
+    """
+    if last_states is None:
+        last_states = {}
+    for unit in units:
+        state = states.get(unit.object_path)
+        if state is not None:
+            unit.seed(state, last_states.get(unit.object_path))
+
+
+def percentile(values, fraction):
+    """Return the ``fraction`` percentile of ``values`` using the nearest-rank
+    method, or ``None`` if ``values`` is empty.
+
+    :type values: [float]
+    :type fraction: float
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, int(round(fraction * len(ordered))) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+@defer.inlineCallbacks
+def connect_units(con, units, concurrency):
+    """Connect all ``units`` on ``con`` with at most ``concurrency``
+    connection attempts in flight at the same time.
+
+    A unit that can't be connected is logged and skipped, it does not prevent
+    the remaining units from being connected.
+
+    :type con: :class:`txdbus.client.DBusClientConnection`
+    :type units: [:class:`sagbescheid.unit.Unit`]
+    :type concurrency: int
+    :return: The units that have been connected successfully.
+    :rtype: [:class:`sagbescheid.unit.Unit`]
+    """
+    semaphore = defer.DeferredSemaphore(concurrency)
+    timings = []
+
+    @defer.inlineCallbacks
+    def connect_one(unit):
+        unit_start = reactor.seconds()
+        try:
+            yield unit.connect(con)
+        except Exception:
+            logging.exception("Connecting %s failed:", unit.object_path)
+            defer.returnValue(None)
+        timings.append(reactor.seconds() - unit_start)
+        defer.returnValue(unit)
+
+    start = reactor.seconds()
+    results = yield defer.gatherResults([semaphore.run(connect_one, unit)
+                                         for unit in units])
+    connected = [unit for unit in results if unit is not None]
+    logging.info("Connected %d of %d units in %.3fs (p50: %.3fs, p99: %.3fs)",
+                 len(connected), len(units), reactor.seconds() - start,
+                 percentile(timings, 0.5) or 0.0,
+                 percentile(timings, 0.99) or 0.0)
+    defer.returnValue(connected)
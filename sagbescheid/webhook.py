@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+"""Sending events to an HTTP endpoint.
+
+Events are POSTed in batches as the UTF-8 encoded JSON object
+``{"events": [<event>, ...]}``, where every event is an object with at least
+the keys ``unit``, ``object_path``, ``event`` and ``time``.
+"""
+import json
+import logging
+
+
+from collections import deque
+from io import BytesIO
+from six import ensure_binary
+from twisted.internet import defer, reactor
+from twisted.web.client import (Agent, FileBodyProducer, HTTPConnectionPool,
+                                readBody)
+from twisted.web.http_headers import Headers
+
+
+# Responses with these codes are retried, other 4xx responses are not.
+RETRY_CODES = frozenset([408, 425, 429])
+
+
+def encode_events(events):
+    """
+    :type events: [dict]
+    :rtype: bytes
+    """
+    return json.dumps({"events": events},
+                      separators=(",", ":")).encode("utf-8")
+
+
+class WebhookSender(object):
+    """POSTs events to ``url`` in batches over persistent connections.
+
+    Events are collected for ``flush_interval`` seconds, or until there are
+    ``batch_max`` of them, and then sent in one request. Only one request is
+    in flight at a time, so events arrive in order. If a request fails, its
+    events are put back into the queue and sent again after a delay that
+    doubles with every failure, up to ``max_retry_delay`` seconds. At most
+    ``queue_size`` events are queued, the oldest ones are dropped first.
+    """
+
+    def __init__(self, url, flush_interval=1, batch_max=100,
+                 queue_size=10000, max_retry_delay=300, timeout=10,
+                 headers=None):
+        """
+        :type url: str
+        :type flush_interval: float
+        :type batch_max: int
+        :type queue_size: int
+        :type max_retry_delay: float
+        :param timeout: The number of seconds to wait for a response.
+        :type timeout: float
+        :param headers: Additional request headers.
+        :type headers: [(str, str)]
+        """
+        self.url = ensure_binary(url)
+        self.flush_interval = flush_interval
+        self.batch_max = batch_max
+        self.queue_size = queue_size
+        self.max_retry_delay = max_retry_delay
+        self.timeout = timeout
+        self.headers = Headers({b"Content-Type": [b"application/json"],
+                                b"User-Agent": [b"sagbescheid"]})
+        for name, value in headers or []:
+            self.headers.addRawHeader(ensure_binary(name),
+                                      ensure_binary(value))
+        self.pool = HTTPConnectionPool(reactor, persistent=True)
+        # There's never more than one request in flight.
+        self.pool.maxPersistentPerHost = 1
+        self.agent = Agent(reactor, connectTimeout=timeout, pool=self.pool)
+        self.queue = deque()
+        self.dropped = 0
+        self._retry_delay = 0
+        self._call = None
+        self._current = None
+        self._stopped = False
+
+    def send(self, event):
+        """
+        :param event: The event, see :func:`encode_events`.
+        :type event: dict
+        """
+        if len(self.queue) >= self.queue_size:
+            self.queue.popleft()
+            self.dropped += 1
+            if self.dropped == 1:
+                logging.warning("The webhook queue is full, dropping the "
+                                "oldest events")
+        self.queue.append(event)
+        if (len(self.queue) >= self.batch_max and self._current is None and
+                not self._retry_delay):
+            self.flush()
+        else:
+            self._schedule()
+
+    def flush(self):
+        """Send the next batch of events, unless a request is in flight.
+
+        :return: A :class:`twisted.internet.defer.Deferred` firing once the
+                 request finished, or ``None`` if none has been sent.
+        """
+        if self._call is not None:
+            if self._call.active():
+                self._call.cancel()
+            self._call = None
+        if self._current is not None or not self.queue:
+            return None
+        batch = [self.queue.popleft()
+                 for _ in range(min(self.batch_max, len(self.queue)))]
+        # Set before adding the callbacks, the request might fail right away.
+        self._current = d = self._post(encode_events(batch))
+        d.addCallbacks(self._sent, self._failed, callbackArgs=(batch,),
+                       errbackArgs=(batch,))
+        d.addBoth(self._finished)
+        return d
+
+    def _post(self, body):
+        """
+        :type body: bytes
+        :return: A :class:`twisted.internet.defer.Deferred` firing with the
+                 response code once the response has been read completely.
+        """
+        d = self.agent.request(b"POST", self.url, self.headers,
+                               FileBodyProducer(BytesIO(body)))
+        timeout = reactor.callLater(self.timeout, d.cancel)
+
+        def read_body(response):
+            # The connection only goes back to the pool once the body has
+            # been read.
+            return readBody(response).addCallback(lambda _: response.code)
+
+        def cancel_timeout(result):
+            if timeout.active():
+                timeout.cancel()
+            return result
+
+        return d.addCallback(read_body).addBoth(cancel_timeout)
+
+    def _sent(self, code, batch):
+        """
+        :type code: int
+        :type batch: [dict]
+        """
+        if 200 <= code < 300:
+            self._retry_delay = 0
+            if self.dropped:
+                logging.warning("Dropped %d events while the webhook was "
+                                "unreachable", self.dropped)
+                self.dropped = 0
+        elif code >= 500 or code in RETRY_CODES:
+            self._retry(batch, "HTTP status %d" % code)
+        else:
+            logging.error("The webhook rejected %d events with HTTP status "
+                          "%d, dropping them", len(batch), code)
+
+    def _failed(self, failure, batch):
+        """
+        :type failure: :class:`twisted.python.failure.Failure`
+        :type batch: [dict]
+        """
+        self._retry(batch, failure.getErrorMessage())
+
+    def _retry(self, batch, reason):
+        """Put ``batch`` back into the queue and back off.
+
+        :type batch: [dict]
+        :type reason: str
+        """
+        self.queue.extendleft(reversed(batch))
+        while len(self.queue) > self.queue_size:
+            self.queue.popleft()
+            self.dropped += 1
+        self._retry_delay = min(self._retry_delay * 2 or self.flush_interval
+                                or 1, self.max_retry_delay)
+        logging.warning("Sending %d events to the webhook failed (%s), "
+                        "retrying in %gs", len(batch), reason,
+                        self._retry_delay)
+
+    def _finished(self, _):
+        self._current = None
+        self._schedule()
+
+    def _schedule(self):
+        """Schedule sending the next batch, if there are queued events and
+        nothing is scheduled or in flight yet.
+        """
+        if (self._stopped or self._call is not None or
+                self._current is not None or not self.queue):
+            return
+        if self._retry_delay:
+            delay = self._retry_delay
+        elif len(self.queue) >= self.batch_max:
+            delay = 0
+        else:
+            delay = self.flush_interval
+        self._call = reactor.callLater(delay, self.flush)
+
+    def stop(self):
+        """Make a last attempt at sending the queued events and close all
+        connections.
+
+        :return: A :class:`twisted.internet.defer.Deferred` firing once the
+                 connections are closed.
+        """
+        self._stopped = True
+        if self._current is None:
+            self.flush()
+        elif self._call is not None:
+            self._call.cancel()
+            self._call = None
+        d = self._current if self._current is not None else defer.succeed(None)
+
+        def close(_):
+            if self.queue:
+                logging.warning("Dropping %d events that haven't been sent "
+                                "to the webhook", len(self.queue))
+                self.queue.clear()
+            return self.pool.closeCachedConnections()
+
+        return d.addCallback(close)
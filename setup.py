@@ -27,6 +27,11 @@ setup(name="sagbescheid",
                         "six==1.12.0"],
       setup_requires=["setuptools_scm"],
       use_scm_version={"write_to": "sagbescheid/version.py"},
+      entry_points={
+          "console_scripts": [
+              "sagbescheid-collector=sagbescheid.collector:main",
+          ]
+      },
       extras_require={
           'docs': ['sphinx', 'sphinxcontrib-autoprogram']
           }
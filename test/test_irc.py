@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import unittest
+
+
+from collections import deque
+from sagbescheid import irc
+from sagbescheid.notifiers import ircnotifier
+from sagbescheid.unit import UNIT_PATH_PREFIX
+from twisted.internet import task
+from twisted.test import proto_helpers
+
+
+class IRCNotifierBotTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.reactors = irc.reactor, ircnotifier.reactor
+        irc.reactor = ircnotifier.reactor = self.clock
+
+        self.factory = ircnotifier.IRCNotifierFactory()
+        self.factory.channel = "#sagbescheid"
+        self.factory.nick = "sagbescheid"
+        self.factory.aggregation_interval = 1
+        self.factory.buffer_max_age = 3600
+        self.factory._buffer = deque(maxlen=100)
+        self.bot = irc.IRCNotifierBot()
+        self.bot.factory = self.factory
+        self.transport = proto_helpers.StringTransport()
+        self.bot.makeConnection(self.transport)
+        self.factory.client_ready(self.bot)
+        self.transport.clear()
+
+    def tearDown(self):
+        irc.reactor, ircnotifier.reactor = self.reactors
+
+    def messages(self):
+        prefix = "PRIVMSG #sagbescheid :"
+        return [line[len(prefix):]
+                for line in self.transport.value().decode().splitlines()]
+
+    def test_latest_event_of_a_unit(self):
+        object_path = UNIT_PATH_PREFIX + "a_2eservice"
+        self.factory.failure(object_path)
+        self.clock.advance(0.3)
+        self.factory.recovery(object_path)
+        self.clock.advance(0.3)
+        self.factory.failure(object_path)
+        self.clock.pump([1] * 10)
+        self.assertEqual(self.messages(), ["a.service failed."])
+
+    def test_aggregation(self):
+        for name in ["a", "b", "c"]:
+            self.factory.failure(UNIT_PATH_PREFIX + name + "_2eservice")
+        self.factory.recovery(UNIT_PATH_PREFIX + "d_2eservice")
+        self.clock.advance(1)
+        self.assertEqual(self.messages(),
+                         ["failed: a.service, b.service, c.service"])
+        self.clock.advance(1)
+        self.assertEqual(self.messages()[1:], ["d.service recovered."])
+
+    def test_pending_events_are_buffered_on_disconnect(self):
+        object_path = UNIT_PATH_PREFIX + "a_2eservice"
+        self.factory.failure(object_path)
+        self.bot.connectionLost(None)
+        self.assertEqual([(event_name, path) for _, event_name, path, _
+                          in self.factory._buffer],
+                         [("failure", object_path)])
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import unittest
+
+
+from sagbescheid import notifier
+from sagbescheid.notifier import FlapSuppressor, NotifierRegistry
+from twisted.internet import task
+
+
+class FlapSuppressorTest(unittest.TestCase):
+    OBJECT_PATH = "/org/freedesktop/systemd1/unit/a_2eservice"
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.reactor = notifier.reactor
+        notifier.reactor = self.clock
+        self.emitted = []
+        self.suppressor = FlapSuppressor(
+            {"failure": 60}, lambda *args: self.emitted.append(args))
+
+    def tearDown(self):
+        notifier.reactor = self.reactor
+
+    def admit_all(self, event_names):
+        return [event_name for event_name in event_names
+                if self.suppressor.admit(self.OBJECT_PATH, event_name)]
+
+    def test_events_without_window(self):
+        self.assertEqual(self.admit_all(["recovery", "normal_stop",
+                                         "normal_start"]),
+                         ["recovery", "normal_stop", "normal_start"])
+        self.assertEqual(self.suppressor.open_windows, {})
+
+    def test_suppress_all_events_in_window(self):
+        self.assertEqual(self.admit_all(["failure", "recovery", "failure",
+                                         "recovery", "failure"]),
+                         ["failure"])
+        self.assertEqual(self.emitted, [])
+        self.clock.advance(60)
+        self.assertEqual(self.emitted, [(self.OBJECT_PATH, "flapping", 5, 60,
+                                         "failure")])
+        self.assertEqual(self.suppressor.open_windows, {})
+
+    def test_close_without_suppressed_events(self):
+        self.assertEqual(self.admit_all(["failure"]), ["failure"])
+        self.clock.advance(60)
+        self.assertEqual(self.emitted, [])
+        self.assertEqual(self.admit_all(["recovery", "failure"]),
+                         ["recovery", "failure"])
+
+    def test_window_closes(self):
+        self.admit_all(["failure", "recovery"])
+        self.clock.advance(59)
+        self.assertEqual(self.admit_all(["failure"]), [])
+        self.clock.advance(1)
+        self.assertEqual(self.emitted, [(self.OBJECT_PATH, "flapping", 3, 60,
+                                         "failure")])
+        self.assertEqual(self.admit_all(["recovery"]), ["recovery"])
+
+    def test_cancel(self):
+        self.admit_all(["failure", "recovery"])
+        self.suppressor.cancel()
+        self.clock.advance(60)
+        self.assertEqual(self.emitted, [])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+class RecordingNotifier(object):
+    name = "recording"
+
+    def __init__(self):
+        self.events = []
+
+    def failure(self, object_path):
+        self.events.append(object_path)
+
+
+class NotifierQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.reactor = notifier.reactor
+        notifier.reactor = self.clock
+        self.notifier = RecordingNotifier()
+
+    def tearDown(self):
+        notifier.reactor = self.reactor
+
+    def test_shrink_on_configure(self):
+        registry = NotifierRegistry([self.notifier], 10)
+        for index in range(10):
+            registry.handle_event("/unit/%d" % index, "failure")
+        registry.configure([self.notifier], 4)
+        queue = registry.queues["recording"]
+        self.assertEqual(queue.depth, 4)
+        self.assertEqual(queue.dropped, 6)
+        registry.handle_event("/unit/10", "failure")
+        self.assertEqual(queue.depth, 4)
+        self.clock.advance(0)
+        self.assertEqual(self.notifier.events,
+                         ["/unit/%d" % index for index in range(7, 11)])
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright © 2026 Wieland Hoffmann
+# License: MIT, see LICENSE for details
+import logging
+import random
+import six
+import string
+import sys
+import unittest
+
+
+from sagbescheid import unit
+from automat import NoTransition
+from sagbescheid.unit import (escape_path_label, STATE_NAMES, TableUnit,
+                              unescape_path_label, Unit, unit_name,
+                              UNIT_PATH_PREFIX)
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+
+class RecordingRegistry(object):
+    """Records the events and state changes of units."""
+
+    def __init__(self):
+        self.calls = []
+
+    def handle_event(self, object_path, event_name):
+        self.calls.append(("event", event_name))
+
+    def unit_state_changed(self, object_path, state):
+        self.calls.append(("state", state))
+
+
+class TransitionTableTest(unittest.TestCase):
+    # ActiveStates systemd knows about, but the state machine doesn't.
+    UNMODELLED_STATES = ["maintenance", "refreshing"]
+
+    def setUp(self):
+        # Failed transitions are logged with their traceback.
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def transition(self, unit_class, state, raw_state):
+        """Return the calls to the registry, the new state and whether the
+        transition failed when moving a ``unit_class`` from ``state`` into
+        ``raw_state``.
+        """
+        registry = RecordingRegistry()
+        unit = unit_class(UNIT_PATH_PREFIX + "nginx_2eservice", registry)
+        unit.restore(state)
+        try:
+            unit._become(raw_state)
+            failed = False
+        except NoTransition:
+            failed = True
+        return registry.calls, unit.state, failed
+
+    def test_same_events(self):
+        for state in STATE_NAMES:
+            for raw_state in STATE_NAMES + self.UNMODELLED_STATES:
+                self.assertEqual(self.transition(Unit, state, raw_state),
+                                 self.transition(TableUnit, state, raw_state),
+                                 "%s -> %s" % (state, raw_state))
+
+    def test_unmodelled_states(self):
+        for unit_class in (Unit, TableUnit):
+            for raw_state in self.UNMODELLED_STATES:
+                self.assertEqual(self.transition(unit_class, "active",
+                                                 raw_state),
+                                 ([], "active", True))
+
+
+class PathCodecTest(unittest.TestCase):
+    # Labels and their escaped forms, as produced by systemds
+    # bus_label_escape.
+    KNOWN_LABELS = [
+        (u"nginx.service", "nginx_2eservice"),
+        (u"getty@tty1.service", "getty_40tty1_2eservice"),
+        (u"a_b.service", "a_5fb_2eservice"),
+        (u"1password.service", "_31password_2eservice"),
+        (u"-.mount", "_2d_2emount"),
+        (u"", "_"),
+        (u"caf\xe9.service", "caf_c3_a9_2eservice"),
+        (u"\U0001f600.scope", "_f0_9f_98_80_2escope"),
+    ]
+
+    def assertRoundTrips(self, label):
+        escaped = escape_path_label(label)
+        self.assertTrue(all(char in string.ascii_letters + string.digits + "_"
+                            for char in escaped), escaped)
+        self.assertNotIn(escaped[0], string.digits)
+        self.assertEqual(six.ensure_text(unescape_path_label(escaped)), label)
+
+    def test_known_labels(self):
+        for label, escaped in self.KNOWN_LABELS:
+            self.assertEqual(escape_path_label(label), escaped)
+            self.assertRoundTrips(label)
+
+    def test_fuzz(self):
+        rng = random.Random(4711)
+        alphabet = ([six.unichr(char) for char in range(1, 128)] +
+                    [u"\xe9", u"\xfc", u"€", u"\U0001f600"])
+        for _ in range(20000):
+            label = u"".join(rng.choice(alphabet)
+                             for _ in range(rng.randint(0, 16)))
+            self.assertRoundTrips(label)
+
+    def test_invalid_escapes(self):
+        for label in ["a_", "a_z1", "_4", "a_g0"]:
+            self.assertRaises(ValueError, unescape_path_label, label)
+
+    def test_unit_name(self):
+        self.assertEqual(unit_name(UNIT_PATH_PREFIX + "getty_40tty1_2eservice"),
+                         "getty@tty1.service")
+        self.assertEqual(unit_name("web1:" + UNIT_PATH_PREFIX +
+                                   "nginx_2eservice"),
+                         "web1:nginx.service")
+        # Invalid escapes are shown as they are.
+        self.assertEqual(unit_name(UNIT_PATH_PREFIX + "bad_zz"), "bad_zz")
+
+    def test_unit_name_cache_is_bounded(self):
+        for index in range(unit.UNIT_NAME_CACHE_SIZE + 10):
+            unit_name(UNIT_PATH_PREFIX + "run_2du%d_2escope" % index)
+        self.assertLessEqual(len(unit._unit_names), unit.UNIT_NAME_CACHE_SIZE)
+
+    def test_unit_caches_its_name(self):
+        table_unit = TableUnit(UNIT_PATH_PREFIX + "getty_40tty1_2eservice",
+                               None)
+        self.assertEqual(table_unit.name, "getty@tty1.service")
+        self.assertEqual(table_unit._name, "getty@tty1.service")
+
+
+class TableUnitMemoryTest(unittest.TestCase):
+    # The upper bound for the size of a TableUnit, excluding its object path
+    # and its name, in bytes.
+    MAX_UNIT_SIZE = 80
+
+    def test_no_dict(self):
+        table_unit = TableUnit(UNIT_PATH_PREFIX + "nginx_2eservice", None)
+        self.assertFalse(hasattr(table_unit, "__dict__"))
+
+    def test_getsizeof(self):
+        table_unit = TableUnit(UNIT_PATH_PREFIX + "nginx_2eservice", None)
+        self.assertLessEqual(sys.getsizeof(table_unit), self.MAX_UNIT_SIZE)
+
+    @unittest.skipIf(tracemalloc is None, "tracemalloc is not available")
+    def test_traced_size(self):
+        count = 10000
+        paths = [UNIT_PATH_PREFIX + "bench_2d%d_2eservice" % index
+                 for index in range(count)]
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            units = [TableUnit(path, None) for path in paths]
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        # The list holding the units costs another pointer per unit.
+        per_unit = float(after - before) / len(units) - 8
+        self.assertLessEqual(per_unit, self.MAX_UNIT_SIZE)